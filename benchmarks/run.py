@@ -0,0 +1,269 @@
+"""
+Serialization throughput benchmarks against the django_test_app models.
+
+Every scenario serializes the same rows with qscruncher and with an equivalent
+Django Rest Framework ModelSerializer, in an in-memory SQLite database:
+
+    python benchmarks/run.py --sizes 100 1000 10000 --output results.json
+
+Pass ``--compare`` with an earlier results file to fail on throughput
+regressions larger than ``--threshold``.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [
+    str(ROOT / "src"),
+    str(ROOT / "django_integration_tests" / "django_test_project"),
+]
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_test_project.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from django_test_app.models import (  # noqa: E402
+    RelatedManyToManyModel,
+    RelatedModel,
+    RelatedOneToOneModel,
+    ReverseModel,
+    TestModel,
+)
+from rest_framework import serializers  # noqa: E402
+
+import qscruncher  # noqa: E402
+from qscruncher import all_fields, fields, pk, qs_to_list, ref, refs  # noqa: E402
+
+
+class RelatedModelSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RelatedModel
+        fields = ["id", "text_field"]
+
+
+class ReverseModelSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReverseModel
+        fields = ["id"]
+
+
+class FlatSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TestModel
+        fields = ["id", "char_field", "integer_field", "float_field", "foreign_key"]
+
+
+class AllFieldsSerializer(serializers.ModelSerializer):
+    reversemodel_set = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = TestModel
+        fields = "__all__"
+
+
+class NestedSerializer(serializers.ModelSerializer):
+    foreign_key = RelatedModelSerializer()
+    reversemodel_set = ReverseModelSerializer(many=True)
+
+    class Meta:
+        model = TestModel
+        fields = ["id", "char_field", "foreign_key", "reversemodel_set"]
+
+
+def flat_queryset():
+    return TestModel.objects.order_by("id")
+
+
+def all_fields_queryset():
+    return (
+        TestModel.objects.order_by("id")
+        .select_related("foreign_key", "one_to_one_field")
+        .prefetch_related("many_to_many_field", "reversemodel_set")
+    )
+
+
+def nested_queryset():
+    return (
+        TestModel.objects.order_by("id")
+        .select_related("foreign_key")
+        .prefetch_related("reversemodel_set")
+    )
+
+
+SCENARIOS = {
+    "flat": (
+        flat_queryset,
+        [fields("id", "char_field", "integer_field", "float_field", "foreign_key")],
+        FlatSerializer,
+    ),
+    "all_fields": (
+        all_fields_queryset,
+        [all_fields(reversemodel_set=refs(pk()))],
+        AllFieldsSerializer,
+    ),
+    "nested": (
+        nested_queryset,
+        [
+            fields(
+                "id",
+                "char_field",
+                foreign_key=ref(fields("id", "text_field")),
+                reversemodel_set=refs(fields("id")),
+            )
+        ],
+        NestedSerializer,
+    ),
+}
+
+
+def create_rows(size: int):
+    TestModel.objects.all().delete()
+    RelatedModel.objects.all().delete()
+    RelatedOneToOneModel.objects.all().delete()
+    RelatedManyToManyModel.objects.all().delete()
+
+    related = RelatedModel.objects.bulk_create(
+        RelatedModel(text_field=f"related {i}") for i in range(max(1, size // 10))
+    )
+    one_to_ones = RelatedOneToOneModel.objects.bulk_create(
+        RelatedOneToOneModel(text_field=f"one to one {i}") for i in range(size)
+    )
+    m2m = RelatedManyToManyModel.objects.bulk_create(
+        RelatedManyToManyModel(text_field=f"m2m {i}") for i in range(20)
+    )
+    test_models = TestModel.objects.bulk_create(
+        TestModel(
+            char_field=f"char {i}",
+            text_field="text " * 20,
+            decimal_field=i,
+            integer_field=i,
+            float_field=i / 3,
+            foreign_key=related[i % len(related)],
+            one_to_one_field=one_to_ones[i],
+        )
+        for i in range(size)
+    )
+    through = TestModel.many_to_many_field.through
+    through.objects.bulk_create(
+        through(testmodel_id=test_model.id, relatedmanytomanymodel_id=m.id)
+        for index, test_model in enumerate(test_models)
+        for m in m2m[index % 5 : index % 5 + 3]
+    )
+    ReverseModel.objects.bulk_create(
+        ReverseModel(relation=test_model)
+        for test_model in test_models
+        for _ in range(2)
+    )
+
+
+def measure(serialize, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = serialize()
+        timings.append(time.perf_counter() - start)
+
+    with CaptureQueriesContext(connection) as queries:
+        tracemalloc.start()
+        serialize()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    best = min(timings)
+    return {
+        "rows": len(rows),
+        "seconds": best,
+        "rows_per_second": len(rows) / best if best else None,
+        "peak_memory_bytes": peak,
+        "queries": len(queries),
+    }
+
+
+def run(sizes, repeat: int) -> dict:
+    results = []
+    for size in sizes:
+        create_rows(size)
+        for scenario, (queryset, transforms, serializer) in SCENARIOS.items():
+            for implementation, serialize in [
+                ("qscruncher", lambda: qs_to_list(queryset(), *transforms)),
+                ("drf", lambda: serializer(queryset(), many=True).data),
+            ]:
+                result = measure(serialize, repeat)
+                result.update(
+                    size=size, scenario=scenario, implementation=implementation
+                )
+                results.append(result)
+                print(
+                    f"{size:>8} {scenario:<12} {implementation:<12}"
+                    f" {result['rows_per_second']:>12.0f} rows/s"
+                    f" {result['peak_memory_bytes'] / 1024:>10.0f} KiB"
+                    f" {result['queries']:>4} queries"
+                )
+
+    return {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "qscruncher": getattr(qscruncher, "__version__", None),
+        "results": results,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    def key(result):
+        return result["size"], result["scenario"], result["implementation"]
+
+    baseline_results = {key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        previous = baseline_results.get(key(result))
+        if previous is None or not previous["rows_per_second"]:
+            continue
+        change = result["rows_per_second"] / previous["rows_per_second"] - 1
+        if change < -threshold or result["queries"] > previous["queries"]:
+            regressions.append((key(result), change, result["queries"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        results = run(args.sizes, args.repeat)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+    if args.compare:
+        regressions = compare(
+            results, json.loads(args.compare.read_text()), args.threshold
+        )
+        for (size, scenario, implementation), change, queries in regressions:
+            print(
+                f"Regression: {implementation} {scenario} at {size} rows:"
+                f" {change:+.0%} rows/s, {queries} queries"
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
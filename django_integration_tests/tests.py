@@ -1,28 +1,78 @@
+import csv
+import io
+import json
+import pickle
+import subprocess
+import sys
+from array import array
+from unittest import mock
 from unittest.mock import Mock
 
 import pytest
+from asgiref.sync import async_to_sync
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Manager, Prefetch, QuerySet
+from django.db.models.signals import pre_init
+from django.http import StreamingHttpResponse
+from django.test import override_settings
 from django_test_app.models import (
     RelatedManyToManyModel,
     RelatedModel,
+    RelatedOneToOneModel,
     ReverseModel,
     TestModel,
 )
 from factory import Faker
 from factory.django import DjangoModelFactory
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import (
+    CharField,
+    FloatField,
+    ModelSerializer,
+    SerializerMethodField,
+)
 
 from qscruncher import (
+    AllFields,
+    DjangoRowCache,
+    Exclude,
+    Fields,
+    LocMemRowCache,
+    Page,
+    Ref,
+    Refs,
     UncachedRelationError,
     all_fields,
+    aqs_to_iter,
+    aqs_to_list,
     exclude,
     fields,
     instance_to_value,
+    meta,
     model_serializer_fields,
+    optimize,
+    paginate,
+    parallel_qs_to_iter,
     pk,
+    profile,
+    qs_to_columns,
+    qs_to_csv_stream,
+    qs_to_iter,
+    qs_to_json_bytes,
+    qs_to_json_stream,
     qs_to_list,
+    qs_to_ndjson_stream,
+    qs_to_records,
+    qs_to_tuples,
+    record_type,
     ref,
     refs,
+    serialization_profiled,
 )
+from qscruncher.conf import get_config
+from qscruncher.drf import CrunchedModelSerializer
+from qscruncher.meta import clear_model_meta, model_fields, model_meta, warm_model_meta
+from qscruncher.parallel import _pk_ranges
+from qscruncher.qscruncher import _serialize_instances, compile_transforms
 
 
 class TestModelFactory(DjangoModelFactory):
@@ -218,6 +268,1286 @@ def test_pk():
     assert pk()(instance, None) == instance.pk
 
 
+@pytest.mark.django_db
+def test_plan_compiled_once_per_model(cached_instance):
+    transform = fields("id", "foreign_key")
+    plan = transform.compile(TestModel)
+    assert transform.compile(TestModel) is plan
+    # Equal specs share the plan, which is dropped along with the metadata
+    assert fields("id", "foreign_key").compile(TestModel) is plan
+    clear_model_meta(TestModel)
+    assert transform.compile(TestModel) is not plan
+    assert transform.compile(TestModel) == plan
+    assert [(entry.name, entry.attname) for entry in plan] == [
+        ("id", "id"),
+        ("foreign_key", "foreign_key_id"),
+    ]
+
+
+@pytest.mark.django_db
+def test_compile_transforms_merges_plans(cached_instance):
+    compiled = compile_transforms(TestModel, [fields("id"), fields("char_field"), pk()])
+    assert len(compiled) == 2
+    assert [entry.name for entry in compiled[0].compile(TestModel)] == [
+        "id",
+        "char_field",
+    ]
+    assert instance_to_value(cached_instance, *compiled[:1]) == {
+        "id": cached_instance.id,
+        "char_field": cached_instance.char_field,
+    }
+
+
+@pytest.mark.django_db
+def test_reverse_relation_kwarg(cached_instance):
+    reverse = ReverseModel.objects.create(relation=cached_instance)
+    instance = TestModel.objects.prefetch_related("reversemodel_set").get(
+        pk=cached_instance.pk
+    )
+    result = fields(reversemodel_set=refs(fields("id", "relation")))(instance, {})
+    assert result == {
+        "reversemodel_set": [{"id": reverse.id, "relation": cached_instance.id}]
+    }
+
+
+@pytest.mark.django_db
+def test_optimize_lookups():
+    transforms = [
+        fields(
+            "char_field",
+            foreign_key=ref(fields("text_field")),
+            reversemodel_set=refs(fields("id")),
+        )
+    ]
+    qs = optimize(TestModel.objects.all(), *transforms)
+    assert qs.query.select_related == {"foreign_key": {}}
+    (prefetch,) = qs._prefetch_related_lookups
+    assert prefetch.prefetch_to == "reversemodel_set"
+    assert prefetch.queryset.query.deferred_loading == ({"relation", "id"}, False)
+    assert qs.query.deferred_loading == (
+        {"char_field", "foreign_key", "foreign_key__text_field"},
+        False,
+    )
+
+
+@pytest.mark.django_db
+def test_optimize_reverse_many_to_many(django_assert_num_queries):
+    related = RelatedManyToManyFactory()
+    test_model = TestModelFactory()
+    test_model.many_to_many_field.add(related)
+
+    # Reverse many-to-many relations are prefetched through their accessor
+    transforms = [
+        fields("id", testmodel=refs(fields("id", foreign_key=ref(fields("id")))))
+    ]
+    qs = optimize(RelatedManyToManyModel.objects.all(), *transforms)
+    (prefetch,) = qs._prefetch_related_lookups
+    assert prefetch.prefetch_to == "testmodel_set"
+    with django_assert_num_queries(2):
+        assert qs_to_list(qs, *transforms) == [
+            {
+                "id": related.id,
+                "testmodel": [{"id": test_model.id, "foreign_key": None}],
+            }
+        ]
+
+
+@pytest.mark.django_db
+def test_optimize_num_queries(django_assert_num_queries):
+    for _ in range(3):
+        test_model = TestModelFactory(foreign_key=RelatedModelFactory())
+        ReverseModel.objects.create(relation=test_model)
+        test_model.many_to_many_field.set([RelatedManyToManyFactory()])
+
+    transforms = [
+        fields(
+            "id",
+            foreign_key=ref(fields("text_field")),
+            reversemodel_set=refs(fields("id")),
+            many_to_many_field=refs(fields("text_field")),
+        )
+    ]
+    with django_assert_num_queries(3):
+        result = qs_to_list(optimize(TestModel.objects.all(), *transforms), *transforms)
+    assert len(result) == 3
+    assert len(result[0]["reversemodel_set"]) == 1
+
+
+@pytest.mark.django_db
+def test_optimize_custom_transform_loads_all_columns():
+    qs = optimize(TestModel.objects.all(), fields("id"), pk())
+    assert qs.query.deferred_loading == (frozenset(), True)
+
+
+@pytest.mark.django_db
+def test_optimize_keeps_existing_prefetch():
+    qs = optimize(
+        TestModel.objects.prefetch_related("reversemodel_set"),
+        fields(reversemodel_set=refs(fields("id"))),
+    )
+    assert qs._prefetch_related_lookups == ("reversemodel_set",)
+
+
+@pytest.fixture
+def model_inits():
+    inits = []
+
+    def receiver(sender, **kwargs):
+        inits.append(sender)
+
+    pre_init.connect(receiver)
+    yield inits
+    pre_init.disconnect(receiver)
+
+
+@pytest.mark.django_db
+def test_qs_to_list_flat_values(model_inits, django_assert_num_queries):
+    test_model = TestModelFactory(foreign_key=RelatedModelFactory())
+    qs = TestModel.objects.prefetch_related("many_to_many_field")
+    model_inits.clear()
+
+    with django_assert_num_queries(1):
+        result = qs_to_list(qs, fields("id", "char_field"), fields("foreign_key"))
+    assert result == [
+        {
+            "id": test_model.id,
+            "char_field": test_model.char_field,
+            "foreign_key": test_model.foreign_key_id,
+        }
+    ]
+    assert model_inits == []
+    assert qs_to_list(qs, exclude("many_to_many_field", "reversemodel_set")) == [
+        instance_to_value(test_model, exclude("many_to_many_field", "reversemodel_set"))
+    ]
+
+
+@pytest.mark.django_db
+def test_qs_to_list_evaluated_qs_skips_values(model_inits):
+    TestModelFactory()
+    qs = TestModel.objects.all()
+    list(qs)
+    model_inits.clear()
+    with mock.patch.object(QuerySet, "values_list") as values_list:
+        assert len(qs_to_list(qs, fields("id"))) == 1
+    values_list.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_qs_to_iter_prefetches_per_chunk(django_assert_num_queries):
+    test_models = [TestModelFactory() for _ in range(5)]
+    for test_model in test_models:
+        ReverseModel.objects.create(relation=test_model)
+
+    qs = TestModel.objects.order_by("id").prefetch_related("reversemodel_set")
+    transforms = [fields("id", reversemodel_set=refs(fields("id")))]
+    # One query for the rows and one prefetch query per chunk of two
+    with django_assert_num_queries(4):
+        result = list(qs_to_iter(qs, *transforms, chunk_size=2))
+    assert result == qs_to_list(qs, *transforms)
+    assert [row["id"] for row in result] == [m.id for m in test_models]
+
+
+@pytest.mark.django_db
+def test_qs_to_iter_flat_values(model_inits):
+    test_model = TestModelFactory()
+    model_inits.clear()
+    iterator = qs_to_iter(TestModel.objects.all(), fields("id", "char_field"))
+    assert next(iterator) == {"id": test_model.id, "char_field": test_model.char_field}
+    assert model_inits == []
+
+
+@pytest.mark.django_db
+def test_qs_to_iter_evaluated_qs(django_assert_num_queries):
+    test_model = TestModelFactory()
+    qs = TestModel.objects.all()
+    list(qs)
+    with django_assert_num_queries(0):
+        assert list(qs_to_iter(qs, fields("id"))) == [{"id": test_model.id}]
+
+
+def _json_roundtrip(value):
+    return json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+
+
+@pytest.mark.django_db
+def test_qs_to_json_bytes():
+    for _ in range(3):
+        test_model = TestModelFactory(foreign_key=RelatedModelFactory())
+        ReverseModel.objects.create(relation=test_model)
+
+    qs = (
+        TestModel.objects.order_by("id")
+        .select_related("foreign_key", "one_to_one_field")
+        .prefetch_related("many_to_many_field", "reversemodel_set")
+    )
+    for transforms in [
+        [all_fields(foreign_key=ref(fields("id", "text_field")))],
+        [fields("id", "char_field", "decimal_field", "date_time_field")],
+        [fields("char_field"), pk()],
+    ]:
+        expected = _json_roundtrip(qs_to_list(qs, *transforms))
+        assert json.loads(qs_to_json_bytes(qs, *transforms, chunk_size=2)) == expected
+
+
+@pytest.mark.django_db
+def test_qs_to_json_stream():
+    assert qs_to_json_bytes(TestModel.objects.all(), fields("id")) == b"[]"
+
+    test_model = TestModelFactory()
+    out = io.BytesIO()
+    qs_to_json_stream(TestModel.objects.all(), out, fields("id", "decimal_field"))
+    expected = (
+        f'[{{"id":{test_model.id},"decimal_field":"{test_model.decimal_field}"}}]'
+    )
+    assert out.getvalue() == expected.encode()
+
+    out = bytearray()
+    qs_to_json_stream(list(TestModel.objects.all()), out, fields("id"))
+    assert out == f'[{{"id":{test_model.id}}}]'.encode()
+
+
+@pytest.mark.django_db
+def test_pk_ranges():
+    assert _pk_ranges(TestModel.objects.all(), 4) == []
+    test_models = [TestModelFactory() for _ in range(10)]
+    low, high = test_models[0].pk, test_models[-1].pk
+    ranges = _pk_ranges(TestModel.objects.all(), 4)
+    assert ranges == [
+        (low, low + 2),
+        (low + 3, low + 5),
+        (low + 6, low + 8),
+        (low + 9, high),
+    ]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_qs_to_list_workers():
+    for _ in range(10):
+        test_model = TestModelFactory()
+        ReverseModel.objects.create(relation=test_model)
+
+    qs = TestModel.objects.prefetch_related("reversemodel_set")
+    transforms = [fields("id", reversemodel_set=refs(fields("id")))]
+    expected = qs_to_list(qs.order_by("pk"), *transforms)
+    assert qs_to_list(qs, *transforms, workers=2) == expected
+
+    # Querysets that can't be split are serialized serially
+    for unsupported in [qs[2:5], qs.order_by("-id"), qs.distinct()]:
+        expected = qs_to_list(unsupported, *transforms)
+        assert qs_to_list(unsupported, *transforms, workers=2) == expected
+        with pytest.raises(ValueError):
+            list(parallel_qs_to_iter(unsupported, *transforms, workers=2))
+
+
+@pytest.mark.django_db
+def test_parallel_qs_to_iter_in_transaction():
+    with pytest.raises(ValueError):
+        list(parallel_qs_to_iter(TestModel.objects.all(), fields("id"), workers=2))
+
+    # qs_to_list serializes in the calling process instead
+    test_model = TestModelFactory()
+    rows = qs_to_list(TestModel.objects.all(), fields("id"), workers=2)
+    assert rows == [{"id": test_model.id}]
+
+
+def test_transform_specs():
+    transform = fields(
+        "id", foreign_key=ref(fields("id")), many_to_many_field=refs(pk())
+    )
+    same = fields("id", foreign_key=ref(fields("id")), many_to_many_field=refs(pk()))
+    assert transform == same
+    assert hash(transform) == hash(same)
+    assert transform != fields("id")
+    assert transform.names == ("id",)
+    assert dict(transform.kwargs)["foreign_key"] == Ref((Fields(("id",)),))
+    assert isinstance(dict(transform.kwargs)["many_to_many_field"], Refs)
+    assert exclude("id") == Exclude(("id",))
+    assert all_fields() == AllFields()
+
+
+@pytest.mark.django_db
+def test_transform_specs_pickle(cached_instance_with_foreign_key):
+    transform = all_fields(foreign_key=ref(fields("id", "text_field")))
+    expected = transform(cached_instance_with_foreign_key, {})
+    restored = pickle.loads(pickle.dumps(transform))
+    assert restored == transform
+    assert restored(cached_instance_with_foreign_key, {}) == expected
+
+
+@pytest.mark.django_db
+def test_native_relation_loader(model_inits, django_assert_num_queries):
+    test_models = [TestModelFactory() for _ in range(3)]
+    m2m_models = [RelatedManyToManyFactory() for _ in range(2)]
+    for test_model in test_models[:2]:
+        ReverseModel.objects.create(relation=test_model)
+        test_model.many_to_many_field.set(m2m_models)
+    model_inits.clear()
+
+    qs = TestModel.objects.order_by("id").prefetch_related("reversemodel_set")
+    transforms = [
+        fields(
+            "id",
+            reversemodel_set=refs(fields("id")),
+            many_to_many_field=refs(fields("id", "text_field")),
+        ),
+    ]
+    with django_assert_num_queries(3):
+        result = qs_to_list(qs, *transforms)
+    assert set(model_inits) == {TestModel}
+
+    expected = qs_to_list(list(qs.prefetch_related("many_to_many_field")), *transforms)
+    assert result == expected
+    assert result[2] == {
+        "id": test_models[2].id,
+        "reversemodel_set": [],
+        "many_to_many_field": [],
+    }
+    assert list(qs_to_iter(qs, *transforms, chunk_size=2)) == expected
+    assert json.loads(qs_to_json_bytes(qs, *transforms)) == expected
+
+
+@pytest.mark.django_db
+def test_native_relation_loader_custom_prefetch():
+    test_model = TestModelFactory()
+    reverse = ReverseModel.objects.create(relation=test_model)
+    ReverseModel.objects.create(relation=test_model)
+    qs = TestModel.objects.prefetch_related(
+        Prefetch("reversemodel_set", ReverseModel.objects.filter(id=reverse.id))
+    )
+    result = qs_to_list(qs, fields(reversemodel_set=refs(fields("id"))))
+    assert result == [{"reversemodel_set": [{"id": reverse.id}]}]
+
+
+@pytest.mark.django_db
+def test_pk_relation_loader(model_inits, django_assert_num_queries):
+    test_models = [TestModelFactory() for _ in range(2)]
+    m2m_models = [RelatedManyToManyFactory() for _ in range(3)]
+    test_models[0].many_to_many_field.set(m2m_models)
+    reverse = ReverseModel.objects.create(relation=test_models[1])
+    model_inits.clear()
+
+    qs = TestModel.objects.order_by("id")
+    with django_assert_num_queries(3) as captured:
+        result = qs_to_list(qs, all_fields())
+    assert set(model_inits) == {TestModel}
+    assert (
+        "django_test_app_relatedmanytomanymodel"
+        not in captured.captured_queries[1]["sql"]
+    )
+    assert sorted(result[0]["many_to_many_field"]) == [m.id for m in m2m_models]
+    assert result[0]["reversemodel_set"] == []
+    assert result[1]["many_to_many_field"] == []
+    assert result[1]["reversemodel_set"] == [reverse.id]
+
+    assert result == qs_to_list(
+        list(qs.prefetch_related("many_to_many_field", "reversemodel_set")),
+        all_fields(),
+    )
+
+    # Default managers that filter their rows are joined
+    class VisibleManager(Manager):
+        def get_queryset(self):
+            return super().get_queryset().exclude(text_field="hidden")
+
+    manager = VisibleManager()
+    manager.model = RelatedManyToManyModel
+    m2m_models[0].text_field = "hidden"
+    m2m_models[0].save()
+    with mock.patch.object(RelatedManyToManyModel._meta, "default_manager", manager):
+        result = qs_to_list(qs.all(), fields("id", many_to_many_field=refs(pk())))
+    assert sorted(result[0]["many_to_many_field"]) == [m.id for m in m2m_models[1:]]
+
+
+@pytest.mark.django_db
+def test_pk_relation_loader_reverse_many_to_many(django_assert_num_queries):
+    test_model = TestModelFactory()
+    m2m_model = RelatedManyToManyFactory()
+    test_model.many_to_many_field.set([m2m_model])
+    assert qs_to_list(
+        RelatedManyToManyModel.objects.all(), fields(testmodel=refs(pk()))
+    ) == [{"testmodel": [test_model.id]}]
+
+    # A prefetch of the accessor is replaced by the loader
+    qs = RelatedManyToManyModel.objects.prefetch_related("testmodel_set")
+    with django_assert_num_queries(2):
+        assert qs_to_list(qs, fields(testmodel=refs(fields("id")))) == [
+            {"testmodel": [{"id": test_model.id}]}
+        ]
+
+
+@pytest.mark.django_db
+def test_profile():
+    for _ in range(2):
+        test_model = TestModelFactory(foreign_key=RelatedModelFactory())
+        ReverseModel.objects.create(relation=test_model)
+    test_model.many_to_many_field.set([RelatedManyToManyFactory()])
+
+    transforms = [
+        fields(
+            "id",
+            foreign_key=ref(fields("id", testmodel_set=refs(pk()))),
+            many_to_many_field=refs(fields("id", testmodel=refs(pk()))),
+            reversemodel_set=refs(pk()),
+        )
+    ]
+    qs = optimize(TestModel.objects.all(), *transforms)
+    receiver = Mock()
+    serialization_profiled.connect(receiver)
+    try:
+        with profile() as stats:
+            result = qs_to_list(qs, *transforms)
+            assert list(qs_to_iter(qs, *transforms)) == result
+    finally:
+        serialization_profiled.disconnect(receiver)
+
+    assert receiver.call_args.kwargs["stats"] is stats
+    assert stats.calls == 2
+    assert stats.rows == 4
+    assert stats.queries > 0
+    assert stats.seconds > 0
+    assert set(stats.transforms) == {
+        "foreign_key",
+        "foreign_key.testmodel_set",
+        "many_to_many_field",
+        "many_to_many_field.testmodel",
+        "reversemodel_set",
+    }
+    assert stats.transforms["foreign_key"].calls == 4
+    assert stats.transforms["foreign_key"].instances == 4
+    assert stats.transforms["many_to_many_field"].instances == 2
+    assert stats.transforms["reversemodel_set"].instances == 4
+    assert stats.transforms["foreign_key.testmodel_set"].instances == 4
+    assert stats.transforms["many_to_many_field.testmodel"].instances == 2
+    assert stats.instances == 4 + 4 + 4 + 2 + 2 + 4
+
+    # The timed transforms of each call are not kept in the model registry
+    compiled = len(meta._registry[RelatedModel][2])
+    for _ in range(3):
+        with profile():
+            qs_to_list(qs, *transforms)
+    assert len(meta._registry[RelatedModel][2]) == compiled
+
+
+@pytest.mark.django_db
+def test_profile_inactive():
+    TestModelFactory()
+    with profile() as stats:
+        pass
+    qs_to_list(TestModel.objects.all(), fields("id"))
+    assert stats.calls == 0
+
+
+@pytest.mark.django_db
+def test_memo():
+    related = RelatedModelFactory()
+    for _ in range(3):
+        TestModelFactory(foreign_key=related)
+    TestModelFactory()
+
+    qs = TestModel.objects.order_by("id").select_related("foreign_key")
+    transforms = [fields("id", foreign_key=ref(fields("id", "text_field")))]
+    expected = qs_to_list(qs, *transforms)
+
+    with profile() as stats:
+        shared = qs_to_list(qs, *transforms, memo="share")
+    assert shared == expected
+    assert shared[0]["foreign_key"] is shared[1]["foreign_key"]
+    assert shared[3]["foreign_key"] is None
+    assert stats.transforms["foreign_key"].instances == 3
+
+    copied = list(qs_to_iter(qs, *transforms, memo="copy", chunk_size=2))
+    assert copied == expected
+    assert copied[0]["foreign_key"] is not copied[1]["foreign_key"]
+
+    with pytest.raises(ValueError):
+        qs_to_list(qs, *transforms, memo="deep")
+
+
+@pytest.mark.django_db
+def test_memo_nested():
+    related = RelatedModelFactory()
+    for _ in range(2):
+        ReverseModel.objects.create(relation=TestModelFactory(foreign_key=related))
+
+    transforms = [
+        fields(
+            reversemodel_set=refs(
+                fields("id", relation=ref(fields(foreign_key=ref(fields("id")))))
+            )
+        )
+    ]
+    qs = TestModel.objects.order_by("id").prefetch_related(
+        "reversemodel_set__relation__foreign_key"
+    )
+    result = qs_to_list(qs, *transforms, memo="share")
+    assert result == qs_to_list(qs, *transforms)
+    first, second = (row["reversemodel_set"][0]["relation"] for row in result)
+    assert first["foreign_key"] is second["foreign_key"]
+
+    # Memos don't outlive their call
+    texts = [
+        fields(
+            reversemodel_set=refs(
+                fields(relation=ref(fields(foreign_key=ref(fields("text_field")))))
+            )
+        )
+    ]
+    qs_to_list(qs.all(), *texts, memo="share")
+    related.text_field = "new"
+    related.save()
+    rows = qs_to_list(qs.all(), *texts, memo="share")
+    assert rows[0]["reversemodel_set"][0]["relation"]["foreign_key"] == {
+        "text_field": "new"
+    }
+
+
+def _char_length(instance, name, data):
+    data[name] = len(instance.char_field)
+
+
+@pytest.mark.django_db
+def test_row_cache(django_assert_num_queries):
+    for _ in range(3):
+        TestModelFactory(foreign_key=RelatedModelFactory())
+    cache = LocMemRowCache()
+    qs = TestModel.objects.order_by("id").select_related("foreign_key")
+    transforms = [fields("id", "char_field", foreign_key=ref(fields("text_field")))]
+    expected = qs_to_list(qs.all(), *transforms)
+
+    assert qs_to_list(qs, *transforms, cache=cache) == expected
+    with django_assert_num_queries(1):
+        assert qs_to_list(qs, *transforms, cache=cache) == expected
+    assert qs_to_list(qs[1:], *transforms, cache=cache) == expected[1:]
+    assert qs_to_list(list(qs.all()), *transforms, cache=cache) == expected
+
+    # Saving a related instance invalidates the rows that include it
+    related = TestModel.objects.get(pk=expected[0]["id"]).foreign_key
+    related.text_field = "changed"
+    related.save()
+    with django_assert_num_queries(2):
+        rows = qs_to_list(qs, *transforms, cache=cache)
+    assert rows[0]["foreign_key"] == {"text_field": "changed"}
+    assert rows[1:] == expected[1:]
+
+    # Without a version field, saving a row invalidates its model
+    TestModel.objects.filter(pk=expected[1]["id"]).update(char_field="stale")
+    assert qs_to_list(qs, *transforms, cache=cache)[1] == expected[1]
+    TestModel.objects.get(pk=expected[1]["id"]).save()
+    assert qs_to_list(qs, *transforms, cache=cache)[1]["char_field"] == "stale"
+
+    # Custom transforms are keyed by their import paths
+    custom = [fields("id", length=_char_length)]
+    qs_to_list(qs, *custom, cache=cache)
+    with django_assert_num_queries(1):
+        rows = qs_to_list(qs, *custom, cache=cache)
+    assert rows == [
+        {"id": row["id"], "length": len(row["char_field"])}
+        for row in qs_to_list(qs.all(), fields("id", "char_field"))
+    ]
+    with pytest.raises(ValueError):
+        qs_to_list(qs, fields("id", length=lambda *args: None), cache=cache)
+
+
+@pytest.mark.django_db
+def test_row_cache_version_field(django_assert_num_queries):
+    test_models = [TestModelFactory() for _ in range(3)]
+    cache = LocMemRowCache(max_size=2, version_field="integer_field")
+    qs = TestModel.objects.order_by("id")
+    transforms = [fields("id", "char_field", "integer_field")]
+
+    qs_to_list(qs, *transforms, cache=cache)
+    assert len(cache._rows) == 2
+
+    # Only the row whose version changed is fetched again
+    qs_to_list(qs[:2], *transforms, cache=cache)
+    test_models[1].save()
+    TestModel.objects.filter(pk=test_models[0].pk).update(
+        char_field="changed", integer_field=F("integer_field") + 1
+    )
+    with django_assert_num_queries(2):
+        rows = qs_to_list(qs[:2], *transforms, cache=cache)
+    assert rows[0]["char_field"] == "changed"
+    assert rows[1] == qs_to_list(qs[:2], *transforms)[1]
+
+
+@pytest.mark.django_db
+def test_django_row_cache():
+    TestModelFactory().many_to_many_field.add(RelatedManyToManyFactory())
+    cache = DjangoRowCache()
+    qs = TestModel.objects.prefetch_related("many_to_many_field")
+    transforms = [fields("id", "many_to_many_field")]
+    expected = qs_to_list(qs.all(), *transforms)
+
+    assert qs_to_list(qs, *transforms, cache=cache) == expected
+    assert qs_to_list(qs, *transforms, cache=cache) == expected
+
+    test_model = qs.get()
+    test_model.many_to_many_field.add(RelatedManyToManyFactory())
+    rows = qs_to_list(qs, *transforms, cache=cache)
+    assert len(rows[0]["many_to_many_field"]) == 2
+
+
+@pytest.mark.django_db
+def test_prune(django_assert_num_queries):
+    for _ in range(2):
+        test_model = TestModelFactory(foreign_key=RelatedModelFactory())
+        ReverseModel.objects.create(relation=test_model)
+
+    transforms = [
+        fields(
+            "id",
+            "char_field",
+            foreign_key=ref(fields("id")),
+            reversemodel_set=refs(fields("id")),
+        )
+    ]
+    qs = (
+        TestModel.objects.order_by("id")
+        .select_related("foreign_key", "one_to_one_field")
+        .prefetch_related("reversemodel_set")
+    )
+    expected = qs_to_list(qs.all(), *transforms)
+
+    with django_assert_num_queries(2) as captured:
+        assert qs_to_list(qs.all(), *transforms, prune=True) == expected
+    sql = captured.captured_queries[0]["sql"]
+    assert "char_field" in sql and "one_to_one_field_id" in sql
+    assert '_testmodel"."text_field"' not in sql
+    assert '_relatedmodel"."text_field"' not in sql
+    assert list(qs_to_iter(qs.all(), *transforms, prune=True)) == expected
+
+    # Custom transforms may read anything
+    custom = [lambda instance, data: {"text": instance.text_field}]
+    with django_assert_num_queries(1) as captured:
+        qs_to_list(TestModel.objects.all(), *custom, prune=True)
+    assert "text_field" in captured.captured_queries[0]["sql"]
+
+
+@pytest.mark.django_db
+def test_deferred_fields():
+    TestModelFactory()
+    qs = TestModel.objects.only("id", "char_field")
+    assert qs_to_list(qs.all(), fields("id", "char_field"))
+
+    # Plain columns are read with values_list regardless of deferral
+    assert qs_to_list(qs.all(), fields("id", "text_field"))
+
+    with pytest.raises(UncachedRelationError, match="text_field, integer_field"):
+        qs_to_list(
+            qs.prefetch_related("many_to_many_field"),
+            fields("id", "text_field", "integer_field", "many_to_many_field"),
+        )
+    with pytest.raises(UncachedRelationError, match="text_field"):
+        qs_to_list(TestModel.objects.defer("text_field"), all_fields())
+
+    def text_length(instance, name, data):
+        data[name] = len(instance.char_field)
+
+    qs = TestModel.objects.defer("text_field")
+    assert qs_to_list(qs, fields("id", text_field=text_length))
+
+
+@pytest.mark.django_db
+def test_aqs_to_iter(django_assert_num_queries):
+    for _ in range(5):
+        test_model = TestModelFactory(foreign_key=RelatedModelFactory())
+        ReverseModel.objects.create(relation=test_model)
+        test_model.many_to_many_field.add(RelatedManyToManyFactory())
+
+    qs = (
+        TestModel.objects.order_by("id")
+        .select_related("foreign_key")
+        .prefetch_related(
+            Prefetch(
+                "reversemodel_set",
+                queryset=ReverseModel.objects.filter(id__gt=0),
+            ),
+            "many_to_many_field",
+        )
+    )
+    transforms = [
+        fields(
+            "id",
+            "many_to_many_field",
+            foreign_key=ref(fields("text_field")),
+            reversemodel_set=refs(fields("id")),
+        )
+    ]
+    expected = qs_to_list(qs.all(), *transforms)
+
+    async def collect(qs, *transforms, **kwargs):
+        return [row async for row in aqs_to_iter(qs, *transforms, **kwargs)]
+
+    # One query for the rows and per chunk a prefetch and a native load
+    with django_assert_num_queries(7):
+        assert async_to_sync(collect)(qs.all(), *transforms, chunk_size=2) == expected
+    assert async_to_sync(aqs_to_list)(qs.all(), *transforms) == expected
+    assert async_to_sync(aqs_to_list)(list(qs.all()), *transforms) == expected
+
+    flat = TestModel.objects.order_by("id")
+    assert async_to_sync(collect)(flat, fields("id"), chunk_size=2) == [
+        {"id": row["id"]} for row in expected
+    ]
+
+
+@pytest.mark.django_db
+def test_qs_to_columns():
+    for _ in range(3):
+        TestModelFactory(foreign_key=RelatedModelFactory())
+    qs = TestModel.objects.order_by("id")
+    transforms = [fields("id", "char_field", "float_field", "foreign_key")]
+    rows = qs_to_list(qs.all(), *transforms)
+
+    columns = qs_to_columns(qs.all(), *transforms)
+    assert columns == {name: [row[name] for row in rows] for name in rows[0]}
+
+    columns = qs_to_columns(qs.all(), *transforms, output="array")
+    assert columns["id"] == array("q", [row["id"] for row in rows])
+    assert columns["float_field"].typecode == "d"
+    # Nullable and non-numeric columns stay lists
+    assert isinstance(columns["foreign_key"], list)
+    assert isinstance(columns["char_field"], list)
+
+    nested = [fields("id", foreign_key=ref(fields("text_field")))]
+    qs = qs.select_related("foreign_key")
+    columns = qs_to_columns(qs.all(), *nested, output="array")
+    assert columns["id"].typecode == "q"
+    assert columns["foreign_key"] == [
+        row["foreign_key"] for row in qs_to_list(qs.all(), *nested)
+    ]
+
+    assert qs_to_columns(qs.none(), *transforms) == {
+        "id": [],
+        "char_field": [],
+        "float_field": [],
+        "foreign_key": [],
+    }
+    columns = qs_to_columns(qs.none(), *nested, output="array")
+    assert columns == {"id": array("q"), "foreign_key": []}
+    with pytest.raises(ValueError):
+        qs_to_columns(qs, *transforms, output="arrow")
+
+
+@pytest.mark.django_db
+def test_qs_to_columns_numpy():
+    numpy = pytest.importorskip("numpy")
+    TestModelFactory()
+    qs = TestModel.objects.all()
+    columns = qs_to_columns(
+        qs,
+        fields("id", "decimal_field", "date_field", "date_time_field"),
+        output="numpy",
+        dtypes={"decimal_field": "float64"},
+    )
+    assert columns["id"].dtype == numpy.int64
+    assert columns["decimal_field"].dtype == numpy.float64
+    assert columns["date_field"].dtype == numpy.dtype("datetime64[D]")
+    assert columns["date_time_field"].dtype == numpy.dtype("datetime64[us]")
+
+
+@pytest.mark.django_db
+def test_qs_to_tuples(django_assert_num_queries):
+    for _ in range(2):
+        test_model = TestModelFactory(foreign_key=RelatedModelFactory())
+        ReverseModel.objects.create(relation=test_model)
+    qs = (
+        TestModel.objects.order_by("id")
+        .select_related("foreign_key")
+        .prefetch_related("reversemodel_set", "many_to_many_field")
+    )
+    transforms = [
+        fields(
+            "id",
+            "many_to_many_field",
+            foreign_key=ref(fields("id", "text_field")),
+            reversemodel_set=refs(fields("id")),
+        )
+    ]
+    expected = qs_to_list(qs.all(), *transforms)
+
+    header, rows = qs_to_tuples(qs.all(), *transforms)
+    assert header == (
+        "id",
+        "many_to_many_field",
+        ("foreign_key", ("id", "text_field")),
+        ("reversemodel_set", ("id",)),
+    )
+    assert rows == [
+        (
+            row["id"],
+            [],
+            (row["foreign_key"]["id"], row["foreign_key"]["text_field"]),
+            [(relation["id"],) for relation in row["reversemodel_set"]],
+        )
+        for row in expected
+    ]
+
+    with django_assert_num_queries(1):
+        header, rows = qs_to_tuples(qs.all(), fields("id", "char_field"))
+    assert header == ("id", "char_field")
+    assert isinstance(rows[0], tuple)
+
+    with pytest.raises(ValueError):
+        qs_to_tuples(qs.all(), fields("id"), lambda instance, data: data)
+
+
+@pytest.mark.django_db
+def test_qs_to_records():
+    TestModelFactory(foreign_key=RelatedModelFactory())
+    qs = TestModel.objects.select_related("foreign_key").prefetch_related(
+        "reversemodel_set"
+    )
+    transforms = [
+        fields(
+            "id",
+            foreign_key=ref(fields("id", "text_field")),
+            reversemodel_set=refs(pk()),
+        )
+    ]
+    (record,) = qs_to_records(qs.all(), *transforms)
+    (expected,) = qs_to_list(qs.all(), *transforms)
+    assert record.id == expected["id"]
+    assert record.foreign_key.text_field == expected["foreign_key"]["text_field"]
+    assert record.reversemodel_set == []
+    assert not hasattr(record, "__dict__")
+    assert type(record) is record_type(("id", "foreign_key", "reversemodel_set"))
+    assert pickle.loads(pickle.dumps(record)) == record
+    assert qs_to_records(list(qs.all()), *transforms) == [record]
+
+
+@pytest.mark.django_db
+def test_relation_caching_checked_once(settings):
+    for _ in range(3):
+        test_model = TestModelFactory(foreign_key=RelatedModelFactory())
+        ReverseModel.objects.create(relation=test_model)
+    transforms = [
+        fields(
+            foreign_key=ref(fields("id")),
+            reversemodel_set=refs(fields("id", relation=ref(fields("id")))),
+        )
+    ]
+
+    with pytest.raises(
+        UncachedRelationError, match="Fields foreign_key, reversemodel_set are"
+    ):
+        qs_to_list(TestModel.objects.all(), *transforms)
+
+    settings.QSCRUNCHER_UNCACHED_RELATION_NO_RAISE = True
+    signal = Mock()
+    settings.QSCRUNCHER_UNCACHED_RELATION_SIGNAL = signal
+    rows = qs_to_list(TestModel.objects.all(), *transforms)
+    assert len(rows) == 3
+    signal.send.assert_called_once()
+
+    qs = TestModel.objects.select_related("foreign_key").prefetch_related(
+        Prefetch(
+            "reversemodel_set",
+            queryset=ReverseModel.objects.select_related("relation"),
+        )
+    )
+    descriptor = TestModel.foreign_key
+    with mock.patch.object(
+        type(descriptor), "is_cached", side_effect=descriptor.is_cached
+    ) as is_cached:
+        assert qs_to_list(qs, *transforms) == rows
+    is_cached.assert_not_called()
+    signal.send.assert_called_once()
+
+    # Django caches the foreign keys of reverse relations back to the parent
+    settings.QSCRUNCHER_UNCACHED_RELATION_NO_RAISE = False
+    back = [
+        fields("id", reversemodel_set=refs(fields("id", relation=ref(fields("id")))))
+    ]
+    qs = TestModel.objects.prefetch_related("reversemodel_set")
+    rows = qs_to_list(qs, *back)
+    assert rows[0]["reversemodel_set"][0]["relation"] == {"id": rows[0]["id"]}
+
+    # and one-to-one relations both ways
+    one_to_one = RelatedOneToOneModel.objects.create(text_field="one")
+    TestModelFactory(one_to_one_field=one_to_one)
+    back = [fields(one_to_one_field=ref(fields("id", testmodel=ref(fields("id")))))]
+    qs = TestModel.objects.select_related("one_to_one_field").order_by("-id")
+    row = qs_to_list(qs, *back)[0]
+    assert row["one_to_one_field"]["testmodel"] == {"id": qs[0].id}
+
+
+@pytest.mark.django_db
+def test_qs_to_ndjson_stream():
+    for _ in range(3):
+        TestModelFactory(foreign_key=RelatedModelFactory())
+    qs = TestModel.objects.order_by("id").select_related("foreign_key")
+
+    for transforms in [
+        [fields("id", "char_field", "decimal_field")],
+        [all_fields(foreign_key=ref(fields("id", "text_field")))],
+    ]:
+        chunks = list(qs_to_ndjson_stream(qs.all(), *transforms, chunk_size=2))
+        assert len(chunks) == 2
+        lines = b"".join(chunks).decode().splitlines()
+        assert [json.loads(line) for line in lines] == _json_roundtrip(
+            qs_to_list(qs.all(), *transforms)
+        )
+
+    response = StreamingHttpResponse(qs_to_ndjson_stream(qs.none(), fields("id")))
+    assert b"".join(response.streaming_content) == b""
+
+
+@pytest.mark.django_db
+def test_json_custom_field_transforms():
+    for _ in range(3):
+        TestModelFactory()
+    qs = TestModel.objects.order_by("id")
+
+    def renamed(instance, name, data):
+        data["renamed"] = instance.id
+
+    def odd_only(instance, name, data):
+        if instance.id % 2:
+            data[name] = instance.id
+
+    def doubled(instance, name, data):
+        data[name] = data["integer_field"] * 2
+
+    transforms = [
+        fields("id", "integer_field", a=renamed, b=odd_only, c=doubled),
+    ]
+    expected = _json_roundtrip(
+        [instance_to_value(instance, *transforms) for instance in qs.all()]
+    )
+    assert json.loads(qs_to_json_bytes(qs.all(), *transforms)) == expected
+    lines = b"".join(qs_to_ndjson_stream(qs.all(), *transforms)).splitlines()
+    assert [json.loads(line) for line in lines] == expected
+
+
+@pytest.mark.django_db
+def test_qs_to_csv_stream():
+    TestModelFactory(foreign_key=RelatedModelFactory())
+    TestModelFactory()
+    qs = (
+        TestModel.objects.order_by("id")
+        .select_related("foreign_key")
+        .prefetch_related("many_to_many_field")
+    )
+    transforms = [
+        fields(
+            "id",
+            "date_time_field",
+            "many_to_many_field",
+            foreign_key=ref(fields("id", "text_field")),
+        )
+    ]
+    rows = qs_to_list(qs.all(), *transforms)
+
+    chunks = list(qs_to_csv_stream(qs.all(), *transforms, chunk_size=1))
+    assert len(chunks) == 2
+    reader = csv.DictReader(io.StringIO(b"".join(chunks).decode()))
+    assert reader.fieldnames == [
+        "id",
+        "date_time_field",
+        "many_to_many_field",
+        "foreign_key.id",
+        "foreign_key.text_field",
+    ]
+    first, second = reader
+    assert first["id"] == str(rows[0]["id"])
+    assert first["date_time_field"] == rows[0]["date_time_field"].isoformat()
+    assert first["many_to_many_field"] == "[]"
+    assert first["foreign_key.text_field"] == rows[0]["foreign_key"]["text_field"]
+    assert second["foreign_key.id"] == ""
+
+    # Custom transforms take the columns from the first row
+    custom = [lambda instance, data: {"id": instance.id, "nested": {"a": 1}}]
+    lines = b"".join(qs_to_csv_stream(qs.all(), *custom, delimiter=";"))
+    assert lines.decode().splitlines()[:2] == ["id;nested.a", f"{rows[0]['id']};1"]
+
+    assert b"".join(qs_to_csv_stream(qs.none(), *transforms)).startswith(b"id,")
+
+
+@pytest.mark.django_db
+def test_paginate(django_assert_num_queries):
+    for index in range(5):
+        test_model = TestModelFactory(integer_field=index % 2)
+        ReverseModel.objects.create(relation=test_model)
+    qs = TestModel.objects.all()
+    nested = [fields("id", reversemodel_set=refs(fields("id")))]
+
+    for transforms in [[fields("id", "char_field")], nested]:
+        expected = qs_to_list(qs.order_by("id").prefetch_related(), *transforms)
+        rows = []
+        cursor = None
+        for page_size in [2, 2, 1]:
+            with django_assert_num_queries(len(transforms[0].kwargs) + 1):
+                page = paginate(qs, *transforms, after=cursor, limit=2)
+            assert len(page.rows) == page_size
+            rows.extend(page.rows)
+            cursor = page.next_cursor
+        assert cursor is None
+        assert rows == expected
+
+    key = ("-integer_field", "id")
+    first = paginate(qs, fields("id"), limit=3, key=key)
+    second = paginate(qs, fields("id"), after=first.next_cursor, limit=3, key=key)
+    assert [row["id"] for row in first.rows + second.rows] == list(
+        qs.order_by("-integer_field", "id").values_list("id", flat=True)
+    )
+
+    # Datetimes keep their microseconds in the cursor
+    key = ("date_time_field", "id")
+    rows = []
+    cursor = None
+    for _ in range(3):
+        page = paginate(qs, fields("id"), after=cursor, limit=2, key=key)
+        rows.extend(page.rows)
+        cursor = page.next_cursor
+    assert cursor is None
+    assert [row["id"] for row in rows] == list(
+        qs.order_by(*key).values_list("id", flat=True)
+    )
+
+    assert paginate(qs.none(), fields("id")) == Page([], None)
+    with pytest.raises(ValueError):
+        paginate(qs, fields("id"), after="not a cursor")
+    with pytest.raises(ValueError):
+        paginate(qs, fields("id"), limit=0)
+
+
+@pytest.mark.django_db
+def test_crunched_model_serializer(django_assert_num_queries):
+    def serializer(base):
+        class RelatedSerializer(ModelSerializer):
+            class Meta:
+                model = RelatedModel
+                fields = "__all__"
+
+        class ManyToManySerializer(ModelSerializer):
+            class Meta:
+                model = RelatedManyToManyModel
+                fields = ["id", "text_field"]
+
+        class Serializer(base):
+            foreign_key = RelatedSerializer(read_only=True)
+            many_to_many_field = ManyToManySerializer(many=True, read_only=True)
+            text = CharField(source="text_field")
+            prefixed = SerializerMethodField()
+
+            def get_prefixed(self, instance):
+                return f"{self.context['prefix']}{instance.char_field}"
+
+            class Meta:
+                model = TestModel
+                fields = [
+                    "id",
+                    "prefixed",
+                    "char_field",
+                    "date_time_field",
+                    "decimal_field",
+                    "foreign_key",
+                    "one_to_one_field",
+                    "many_to_many_field",
+                    "reversemodel_set",
+                    "text",
+                ]
+
+        return Serializer
+
+    for index in range(3):
+        test_model = TestModelFactory(
+            foreign_key=RelatedModelFactory() if index else None
+        )
+        test_model.many_to_many_field.set([RelatedManyToManyFactory()])
+        ReverseModel.objects.create(relation=test_model)
+    qs = TestModel.objects.order_by("id")
+    context = {"prefix": "> "}
+
+    expected = serializer(ModelSerializer)(qs.all(), many=True, context=context).data
+    crunched = serializer(CrunchedModelSerializer)
+    # The joins and prefetches are derived from the serializer
+    with django_assert_num_queries(3):
+        data = crunched(qs.all(), many=True, context=context).data
+    assert data == expected
+    assert [list(row) for row in data] == [list(row) for row in expected]
+
+    # Lists of instances, eg. pages, get the relations prefetched
+    instances = list(qs.all())
+    with django_assert_num_queries(3):
+        data = crunched(instances, many=True, context={"prefix": "< "}).data
+    assert data[1]["prefixed"] == f"< {expected[1]['char_field']}"
+    assert data[1]["foreign_key"] == expected[1]["foreign_key"]
+
+    assert crunched(qs[0], context=context).data == expected[0]
+
+    # Serializers that pick their fields per instance are compiled per set of fields
+    class DynamicSerializer(CrunchedModelSerializer):
+        def __init__(self, *args, only=None, **kwargs):
+            super().__init__(*args, **kwargs)
+            if only is not None:
+                for name in set(self.fields) - set(only):
+                    self.fields.pop(name)
+
+        class Meta:
+            model = TestModel
+            fields = ["id", "char_field"]
+
+    assert DynamicSerializer(qs.all(), many=True, only=["id"]).data == [
+        {"id": row["id"]} for row in expected
+    ]
+    assert DynamicSerializer(qs.all(), many=True).data == [
+        {"id": row["id"], "char_field": row["char_field"]} for row in expected
+    ]
+
+    # Declared fields that coerce the values of the model fields fall back to DRF
+    def coercing(base):
+        class Serializer(base):
+            integer_field = CharField()
+            decimal_field = FloatField()
+
+            class Meta:
+                model = TestModel
+                fields = ["id", "integer_field", "decimal_field"]
+
+        return Serializer
+
+    expected = coercing(ModelSerializer)(qs.all(), many=True).data
+    assert coercing(CrunchedModelSerializer)(qs.all(), many=True).data == expected
+    assert isinstance(expected[0]["integer_field"], str)
+
+
+def test_model_meta():
+    # Installed models are introspected when the app is ready
+    assert TestModel in meta._registry
+
+    _model_meta = model_meta(TestModel)
+    assert _model_meta["char_field"].kind == meta.CONCRETE
+    assert _model_meta["foreign_key"] == (
+        TestModel._meta.get_field("foreign_key"),
+        meta.FOREIGN_KEY,
+        "foreign_key_id",
+        "foreign_key",
+        True,
+        TestModel.foreign_key,
+    )
+    assert _model_meta["one_to_one_field"].kind == meta.ONE_TO_ONE
+    assert _model_meta["many_to_many_field"].kind == meta.MANY_TO_MANY
+    assert _model_meta["reversemodel_set"].kind == meta.REVERSE
+    assert model_meta(RelatedManyToManyModel)["testmodel"].accessor == "testmodel_set"
+    assert model_fields(TestModel)["id"] is TestModel._meta.pk
+
+    clear_model_meta(TestModel)
+    assert TestModel not in meta._registry
+    assert model_meta(TestModel) == _model_meta
+    with override_settings(INSTALLED_APPS=["django_test_app"]):
+        assert not meta._registry
+    warm_model_meta()
+
+
+def test_lazy_import():
+    code = (
+        "import sys, qscruncher;"
+        "assert not [name for name in sys.modules if name.startswith('django.db')];"
+        "import qscruncher.optimizer, qscruncher.profiling;"
+        "assert callable(qscruncher.optimize) and callable(qscruncher.profile)"
+    )
+    subprocess.run(
+        [sys.executable, "-c", code], check=True, env={"PYTHONPATH": ":".join(sys.path)}
+    )
+
+
+def test_config(settings):
+    config = get_config()
+    assert get_config() is config
+    assert not config.uncached_relation_no_raise
+
+    settings.QSCRUNCHER_UNCACHED_RELATION_NO_RAISE = True
+    assert get_config().uncached_relation_no_raise
+
+
+@pytest.mark.django_db
+def test_serialize_columns():
+    for index in range(3):
+        test_model = TestModelFactory(
+            foreign_key=RelatedModelFactory() if index else None
+        )
+        ReverseModel.objects.create(relation=test_model)
+
+    def odd_only(instance, name, data):
+        if instance.id % 2:
+            data[name] = instance.id
+
+    transforms = compile_transforms(
+        TestModel,
+        [
+            fields(
+                "id",
+                foreign_key=ref(fields("id", "text_field")),
+                reversemodel_set=refs(fields("id")),
+                integer_field=odd_only,
+            )
+        ],
+    )
+    qs = TestModel.objects.select_related("foreign_key").prefetch_related(
+        "reversemodel_set"
+    )
+    rows = [instance_to_value(instance, *transforms) for instance in qs.all()]
+    assert _serialize_instances(list(qs.all()), transforms) == rows
+    assert [list(row) for row in _serialize_instances(list(qs.all()), transforms)] == [
+        list(row) for row in rows
+    ]
+    assert rows[0]["foreign_key"] is None
+    assert "integer_field" not in rows[1]
+
+    def renamed(instance, name, data):
+        data["renamed"] = instance.id
+
+    def doubled(instance, name, data):
+        data[name] = data["integer_field"] * 2
+
+    transforms = compile_transforms(
+        TestModel,
+        [fields("id", "integer_field", a=renamed, b=doubled)],
+    )
+    rows = [instance_to_value(instance, *transforms) for instance in qs.all()]
+    assert _serialize_instances(list(qs.all()), transforms) == rows
+    assert rows[0]["renamed"] == rows[0]["id"]
+    assert qs_to_list(qs, *transforms) == rows
+
+
+@pytest.mark.django_db
+def test_max_queries(settings):
+    for _ in range(3):
+        TestModelFactory(foreign_key=RelatedModelFactory())
+
+    def related_text(instance, name, data):
+        data[name] = instance.foreign_key.text_field
+
+    def siblings(instance, name, data):
+        data[name] = [sibling.id for sibling in instance.testmodel_set.all()]
+
+    transforms = [fields("id", related_text=related_text)]
+    qs = TestModel.objects.all()
+    with pytest.raises(UncachedRelationError, match="3 x related_text: SELECT"):
+        qs_to_list(qs, *transforms, max_queries=2)
+    rows = qs_to_list(qs.select_related("foreign_key"), *transforms, max_queries=1)
+    assert len(rows) == 3
+
+    # Nested transforms are reported by their dotted paths
+    nested = [fields("id", foreign_key=ref(fields("id", siblings=siblings)))]
+    signal = Mock()
+    settings.QSCRUNCHER_UNCACHED_RELATION_NO_RAISE = True
+    settings.QSCRUNCHER_UNCACHED_RELATION_SIGNAL = signal
+    rows = qs_to_list(qs.select_related("foreign_key"), *nested, max_queries=1)
+    assert len(rows) == 3
+    msg = signal.send.call_args.kwargs["msg"]
+    assert msg.startswith("4 queries made, over the budget of 1:")
+    assert "3 x foreign_key.siblings: SELECT" in msg
+    assert "1 x queryset: SELECT" in msg
+
+    # The tracked transforms of each call are not kept in the model registry
+    compiled = len(meta._registry[RelatedModel][2])
+    for _ in range(3):
+        qs_to_list(qs.select_related("foreign_key"), *nested, max_queries=10)
+    assert len(meta._registry[RelatedModel][2]) == compiled
+
+
 # todo test automatic adding of field
 
 
@@ -1,42 +1,277 @@
-from typing import Any, Optional
-
-from django.db.models import Model, QuerySet
-
-from .qscruncher import (
-    FieldTransform,
-    InstanceTransform,
-    UncachedRelationError,
-    all_fields,
-    exclude as _exclude,
-    fields as _fields,
-    instance_to_value as _instance_to_value,
-    model_serializer_fields,
-    pk,
-    qs_to_list as _qs_to_list,
-    ref as _ref,
-    refs as _refs,
-)
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Mapping, Optional, Sequence, Union
+
+# The implementation, and with it Django's ORM, is only imported once used
+if TYPE_CHECKING:
+    from django.db.models import Model, QuerySet
+
+    from .cache import RowCache
+    from .pagination import Page
+    from .qscruncher import FieldTransform, InstanceTransform
+
+_LAZY = {
+    "AllFields": ".qscruncher",
+    "DjangoRowCache": ".cache",
+    "Exclude": ".qscruncher",
+    "FieldTransform": ".qscruncher",
+    "Fields": ".qscruncher",
+    "InstanceTransform": ".qscruncher",
+    "LocMemRowCache": ".cache",
+    "Page": ".pagination",
+    "Pk": ".qscruncher",
+    "ProfileStats": ".profiling",
+    "Ref": ".qscruncher",
+    "Refs": ".qscruncher",
+    "RowCache": ".cache",
+    "UncachedRelationError": ".qscruncher",
+    "all_fields": ".qscruncher",
+    "model_serializer_fields": ".qscruncher",
+    "pk": ".qscruncher",
+    "profile": ".profiling",
+    "record_type": ".compact",
+    "serialization_profiled": ".profiling",
+}
+
+
+def __getattr__(name: str):
+    try:
+        module = _LAZY[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    from importlib import import_module
+
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(__all__)
 
 
 def fields(*names: str, **kwargs: FieldTransform) -> InstanceTransform:
+    from .qscruncher import fields as _fields
+
     return _fields(names, **kwargs)
 
 
 def exclude(*exclude_names: str, **kwargs: FieldTransform) -> InstanceTransform:
+    from .qscruncher import exclude as _exclude
+
     return _exclude(exclude_names, **kwargs)
 
 
 def ref(*transforms: InstanceTransform) -> FieldTransform:
+    from .qscruncher import ref as _ref
+
     return _ref(transforms)
 
 
 def refs(*transforms: InstanceTransform) -> FieldTransform:
+    from .qscruncher import refs as _refs
+
     return _refs(transforms)
 
 
 def instance_to_value(instance: Optional[Model], *transforms: InstanceTransform) -> Any:
+    from .qscruncher import instance_to_value as _instance_to_value
+
     return _instance_to_value(instance, transforms)
 
 
-def qs_to_list(qs: QuerySet, *transforms: InstanceTransform):
-    return _qs_to_list(qs, transforms)
+def qs_to_list(
+    qs: QuerySet,
+    *transforms: InstanceTransform,
+    workers: Optional[int] = None,
+    memo: Optional[str] = None,
+    cache: Optional[RowCache] = None,
+    prune: bool = False,
+    max_queries: Optional[int] = None,
+):
+    from .qscruncher import qs_to_list as _qs_to_list
+
+    return _qs_to_list(
+        qs,
+        transforms,
+        workers=workers,
+        memo=memo,
+        cache=cache,
+        prune=prune,
+        max_queries=max_queries,
+    )
+
+
+def parallel_qs_to_iter(
+    qs: QuerySet,
+    *transforms: InstanceTransform,
+    workers: int,
+    start_method: Optional[str] = None,
+    memo: Optional[str] = None,
+):
+    from .parallel import parallel_qs_to_iter as _parallel_qs_to_iter
+
+    return _parallel_qs_to_iter(
+        qs, transforms, workers, start_method=start_method, memo=memo
+    )
+
+
+def qs_to_iter(
+    qs: QuerySet,
+    *transforms: InstanceTransform,
+    chunk_size: int = 2000,
+    memo: Optional[str] = None,
+    prune: bool = False,
+):
+    from .qscruncher import qs_to_iter as _qs_to_iter
+
+    return _qs_to_iter(qs, transforms, chunk_size=chunk_size, memo=memo, prune=prune)
+
+
+async def aqs_to_list(
+    qs: QuerySet,
+    *transforms: InstanceTransform,
+    chunk_size: int = 2000,
+    memo: Optional[str] = None,
+    prune: bool = False,
+):
+    from .aio import aqs_to_list as _aqs_to_list
+
+    return await _aqs_to_list(
+        qs, transforms, chunk_size=chunk_size, memo=memo, prune=prune
+    )
+
+
+def aqs_to_iter(
+    qs: QuerySet,
+    *transforms: InstanceTransform,
+    chunk_size: int = 2000,
+    memo: Optional[str] = None,
+    prune: bool = False,
+):
+    from .aio import aqs_to_iter as _aqs_to_iter
+
+    return _aqs_to_iter(qs, transforms, chunk_size=chunk_size, memo=memo, prune=prune)
+
+
+def qs_to_columns(
+    qs: QuerySet,
+    *transforms: InstanceTransform,
+    output: str = "list",
+    dtypes: Optional[Mapping[str, str]] = None,
+):
+    from .columns import qs_to_columns as _qs_to_columns
+
+    return _qs_to_columns(qs, transforms, output=output, dtypes=dtypes)
+
+
+def qs_to_tuples(qs: QuerySet, *transforms: InstanceTransform):
+    from .compact import qs_to_tuples as _qs_to_tuples
+
+    return _qs_to_tuples(qs, transforms)
+
+
+def qs_to_records(qs: QuerySet, *transforms: InstanceTransform):
+    from .compact import qs_to_records as _qs_to_records
+
+    return _qs_to_records(qs, transforms)
+
+
+def paginate(
+    qs: QuerySet,
+    *transforms: InstanceTransform,
+    after: Optional[str] = None,
+    limit: int = 100,
+    key: Union[str, Sequence[str]] = "pk",
+) -> Page:
+    from .pagination import paginate as _paginate
+
+    return _paginate(qs, transforms, after=after, limit=limit, key=key)
+
+
+def optimize(qs: QuerySet, *transforms: InstanceTransform) -> QuerySet:
+    from .optimizer import optimize as _optimize
+
+    return _optimize(qs, transforms)
+
+
+def qs_to_json_bytes(
+    qs: QuerySet, *transforms: InstanceTransform, chunk_size: int = 2000
+) -> bytes:
+    from .encoder import qs_to_json_bytes as _qs_to_json_bytes
+
+    return _qs_to_json_bytes(qs, transforms, chunk_size=chunk_size)
+
+
+def qs_to_json_stream(
+    qs: QuerySet, out, *transforms: InstanceTransform, chunk_size: int = 2000
+):
+    from .encoder import qs_to_json_stream as _qs_to_json_stream
+
+    return _qs_to_json_stream(qs, transforms, out, chunk_size=chunk_size)
+
+
+def qs_to_ndjson_stream(
+    qs: QuerySet, *transforms: InstanceTransform, chunk_size: int = 2000
+):
+    from .streaming import qs_to_ndjson_stream as _qs_to_ndjson_stream
+
+    return _qs_to_ndjson_stream(qs, transforms, chunk_size=chunk_size)
+
+
+def qs_to_csv_stream(
+    qs: QuerySet,
+    *transforms: InstanceTransform,
+    chunk_size: int = 2000,
+    header: bool = True,
+    **fmtparams,
+):
+    from .streaming import qs_to_csv_stream as _qs_to_csv_stream
+
+    return _qs_to_csv_stream(
+        qs, transforms, chunk_size=chunk_size, header=header, **fmtparams
+    )
+
+
+__all__ = [
+    "AllFields",
+    "DjangoRowCache",
+    "Exclude",
+    "FieldTransform",
+    "Fields",
+    "InstanceTransform",
+    "LocMemRowCache",
+    "Page",
+    "Pk",
+    "ProfileStats",
+    "Ref",
+    "Refs",
+    "RowCache",
+    "UncachedRelationError",
+    "all_fields",
+    "aqs_to_iter",
+    "aqs_to_list",
+    "exclude",
+    "fields",
+    "instance_to_value",
+    "model_serializer_fields",
+    "optimize",
+    "paginate",
+    "parallel_qs_to_iter",
+    "pk",
+    "profile",
+    "qs_to_columns",
+    "qs_to_csv_stream",
+    "qs_to_iter",
+    "qs_to_json_bytes",
+    "qs_to_json_stream",
+    "qs_to_list",
+    "qs_to_ndjson_stream",
+    "qs_to_records",
+    "qs_to_tuples",
+    "record_type",
+    "ref",
+    "refs",
+    "serialization_profiled",
+]
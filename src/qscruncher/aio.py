@@ -0,0 +1,105 @@
+from typing import Any, AsyncIterator, Iterable, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db.models import Model, QuerySet, prefetch_related_objects
+from django.db.models.query import ModelIterable
+
+from .qscruncher import (
+    InstanceTransform,
+    Value,
+    _chunks,
+    _flat_columns,
+    _prepare,
+    _pruned,
+    _qs_to_list,
+    _serialize_chunk,
+    _values_qs,
+    compile_transforms,
+)
+
+
+def _serialize_prefetched_chunk(
+    instances: List[Model],
+    lookups: Tuple[Any, ...],
+    transforms: Tuple[InstanceTransform, ...],
+    loaders: Tuple[Any, ...],
+) -> List[Value]:
+    if lookups:
+        prefetch_related_objects(instances, *lookups)
+    return _serialize_chunk(instances, transforms, loaders)
+
+
+async def _achunks(qs: QuerySet, chunk_size: int) -> AsyncIterator[List[Any]]:
+    """
+    Fetch ``qs`` in chunks of ``chunk_size`` without blocking the event loop.
+    """
+    # Values iterables of some Django versions run their query on the event
+    # loop thread when iterated asynchronously
+    if hasattr(qs, "aiterator") and qs._iterable_class is ModelIterable:
+        chunk = []
+        async for item in qs.aiterator(chunk_size=chunk_size):
+            chunk.append(item)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+        return
+
+    # Otherwise fetch each chunk in a thread
+    chunks = _chunks(qs.iterator(chunk_size=chunk_size), chunk_size)
+    next_chunk = sync_to_async(next)
+    while chunk := await next_chunk(chunks, None):
+        yield chunk
+
+
+async def aqs_to_iter(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    chunk_size: int = 2000,
+    memo: Optional[str] = None,
+    prune: bool = False,
+) -> AsyncIterator[Value]:
+    """
+    Asynchronously serialize ``qs`` ``chunk_size`` rows at a time, for async
+    views. Rows are fetched with async iteration, and the prefetching and
+    serialization of each chunk run in a worker thread, so the event loop is
+    not blocked in between. ``memo`` and ``prune`` work like in qs_to_list.
+    """
+    if prune:
+        qs, transforms = _pruned(qs, transforms)
+
+    if not isinstance(qs, QuerySet) or qs._result_cache is not None:
+        for row in await sync_to_async(_qs_to_list)(qs, transforms, None, memo):
+            yield row
+        return
+
+    if _values_qs(qs) and (
+        columns := _flat_columns(qs.model, compile_transforms(qs.model, transforms))
+    ):
+        names, attnames = columns
+        rows = qs.prefetch_related(None).values_list(*attnames)
+        async for chunk in _achunks(rows, chunk_size):
+            for row in chunk:
+                yield dict(zip(names, row))
+        return
+
+    qs, transforms, loaders = _prepare(qs, transforms, memo)
+    lookups = tuple(qs._prefetch_related_lookups)
+    serialize = sync_to_async(_serialize_prefetched_chunk)
+    async for chunk in _achunks(qs.prefetch_related(None), chunk_size):
+        for row in await serialize(chunk, lookups, transforms, loaders):
+            yield row
+
+
+async def aqs_to_list(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    chunk_size: int = 2000,
+    memo: Optional[str] = None,
+    prune: bool = False,
+) -> List[Value]:
+    """
+    Asynchronous counterpart of qs_to_list, see aqs_to_iter.
+    """
+    return [row async for row in aqs_to_iter(qs, transforms, chunk_size, memo, prune)]
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class QscruncherConfig(AppConfig):
+    name = "qscruncher"
+    verbose_name = "QuerySet Cruncher"
+
+    def ready(self):
+        from .meta import warm_model_meta
+
+        warm_model_meta()
@@ -0,0 +1,87 @@
+import dataclasses
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
+
+from django.db import connections
+from django.db.models import Model, QuerySet
+
+from .qscruncher import FieldTransform, _active_budget, handle_uncached_relation
+
+
+@dataclasses.dataclass
+class QueryBudget:
+    """
+    The queries made within a query_budget() block, with the dotted path of
+    the field transform that made each of them, or None outside transforms.
+    """
+
+    max_queries: int
+    queries: List[Tuple[Optional[str], str]] = dataclasses.field(default_factory=list)
+    path: Optional[str] = None
+
+
+class _TrackedTransform:
+    __slots__ = ("transform", "budget", "path")
+
+    def __init__(self, transform: FieldTransform, budget: QueryBudget, path: str):
+        self.transform = transform
+        self.budget = budget
+        self.path = path
+
+    def __call__(self, instance: Model, name: str, data: dict):
+        budget = self.budget
+        outer = budget.path
+        budget.path = self.path
+        try:
+            self.transform(instance, name, data)
+        finally:
+            budget.path = outer
+
+
+def tracker(budget: QueryBudget) -> Callable[[str, FieldTransform], FieldTransform]:
+    """
+    A rewrite for rewrite_field_transforms that attributes the queries made
+    by field transforms to their paths.
+    """
+
+    def track(path: str, field_transform: FieldTransform) -> FieldTransform:
+        return _TrackedTransform(field_transform, budget, path)
+
+    return track
+
+
+def _report(budget: QueryBudget) -> str:
+    counts = Counter(budget.queries)
+    lines = [
+        f"{count} x {path or 'queryset'}: {sql}"
+        for (path, sql), count in counts.most_common()
+    ]
+    return (
+        f"{len(budget.queries)} queries made, over the budget of"
+        f" {budget.max_queries}:\n" + "\n".join(lines)
+    )
+
+
+@contextmanager
+def query_budget(qs: QuerySet, max_queries: int):
+    """
+    Count the queries made within the block, reporting them like an uncached
+    relation if there are more than ``max_queries``.
+    """
+    budget = QueryBudget(max_queries)
+
+    def count_query(execute, sql, params, many, context):
+        budget.queries.append((budget.path, sql))
+        return execute(sql, params, many, context)
+
+    db = qs.db if isinstance(qs, QuerySet) else "default"
+    token = _active_budget.set(budget)
+    try:
+        with connections[db].execute_wrapper(count_query):
+            yield budget
+    finally:
+        _active_budget.reset(token)
+
+    if len(budget.queries) > max_queries:
+        handle_uncached_relation(_report(budget))
@@ -0,0 +1,362 @@
+import dataclasses
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from types import BuiltinFunctionType, FunctionType
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple, Type
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import connections
+from django.db.models import Model, QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .qscruncher import (
+    InstanceTransform,
+    Value,
+    _chunks,
+    _prepare,
+    _Relation,
+    _serialize_chunk,
+    _Spec,
+    _values_qs,
+    compile_transforms,
+    model_fields,
+)
+
+RowKey = Tuple[str, Any, Any]
+
+# Every live RowCache, so that the model signals can bump their generations
+_caches: "weakref.WeakSet[RowCache]" = weakref.WeakSet()
+_signals_connected = False
+
+
+def _label(model: Type[Model]) -> str:
+    return model._meta.concrete_model._meta.label
+
+
+def _bump(*models: Type[Model]):
+    labels = {_label(model) for model in models if model is not None}
+    for cache in list(_caches):
+        for label in labels:
+            cache.bump(label)
+
+
+def _saved_or_deleted(sender, **kwargs):
+    _bump(sender)
+
+
+def _m2m_changed(sender, instance, action, model, **kwargs):
+    if action.startswith("post_"):
+        _bump(sender, instance.__class__, model)
+
+
+def _connect_signals():
+    global _signals_connected
+    if _signals_connected:
+        return
+    post_save.connect(_saved_or_deleted, dispatch_uid="qscruncher_cache_save")
+    post_delete.connect(_saved_or_deleted, dispatch_uid="qscruncher_cache_delete")
+    m2m_changed.connect(_m2m_changed, dispatch_uid="qscruncher_cache_m2m")
+    _signals_connected = True
+
+
+class RowCache:
+    """
+    Base of the serialized row caches passed to qs_to_list as ``cache``.
+
+    Rows are keyed by their model, primary key, the transforms that produced
+    them and a version token. The token is the value of ``version_field`` for
+    models that have such a field, eg. an ``updated_at`` column, and otherwise
+    a generation counter of the model that is bumped by the post_save,
+    post_delete and m2m_changed signals. Generations of the related models
+    reached by the transforms are always part of the key, so that changes of
+    nested relations invalidate the rows that include them.
+
+    Cached rows are shared between calls and must not be modified.
+    """
+
+    def __init__(self, version_field: Optional[str] = None):
+        self.version_field = version_field
+        _connect_signals()
+        _caches.add(self)
+
+    def get_many(self, keys: Iterable[RowKey]) -> Dict[RowKey, Value]:
+        raise NotImplementedError
+
+    def set_many(self, rows: Dict[RowKey, Value]):
+        raise NotImplementedError
+
+    def generations(self, labels: Iterable[str]) -> Dict[str, Hashable]:
+        raise NotImplementedError
+
+    def bump(self, label: str):
+        raise NotImplementedError
+
+
+class LocMemRowCache(RowCache):
+    """
+    An in-process RowCache that holds at most ``max_size`` rows and evicts the
+    least recently used ones first.
+    """
+
+    def __init__(self, max_size: int = 10000, version_field: Optional[str] = None):
+        super().__init__(version_field)
+        self.max_size = max_size
+        self._rows: "OrderedDict[RowKey, Value]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[RowKey]) -> Dict[RowKey, Value]:
+        found = {}
+        rows = self._rows
+        with self._lock:
+            for key in keys:
+                try:
+                    found[key] = rows[key]
+                except KeyError:
+                    continue
+                rows.move_to_end(key)
+        return found
+
+    def set_many(self, rows: Dict[RowKey, Value]):
+        with self._lock:
+            self._rows.update(rows)
+            for key in rows:
+                self._rows.move_to_end(key)
+            while len(self._rows) > self.max_size:
+                self._rows.popitem(last=False)
+
+    def generations(self, labels: Iterable[str]) -> Dict[str, Hashable]:
+        return {label: self._generations.get(label, 0) for label in labels}
+
+    def bump(self, label: str):
+        with self._lock:
+            self._generations[label] = self._generations.get(label, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+
+
+class DjangoRowCache(RowCache):
+    """
+    A RowCache stored in the Django cache ``alias``, eg. to share the rows
+    between processes. Size limits and eviction are up to the cache backend.
+    """
+
+    def __init__(
+        self,
+        alias: str = "default",
+        timeout: Any = DEFAULT_TIMEOUT,
+        version_field: Optional[str] = None,
+        key_prefix: str = "qscruncher",
+    ):
+        super().__init__(version_field)
+        self.alias = alias
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, key: RowKey) -> str:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return f"{self.key_prefix}:row:{digest}"
+
+    def _generation_key(self, label: str) -> str:
+        return f"{self.key_prefix}:generation:{label}"
+
+    def get_many(self, keys: Iterable[RowKey]) -> Dict[RowKey, Value]:
+        cache_keys = {self._key(key): key for key in keys}
+        found = self.cache.get_many(cache_keys)
+        return {cache_keys[cache_key]: row for cache_key, row in found.items()}
+
+    def set_many(self, rows: Dict[RowKey, Value]):
+        self.cache.set_many(
+            {self._key(key): row for key, row in rows.items()}, self.timeout
+        )
+
+    def generations(self, labels: Iterable[str]) -> Dict[str, Hashable]:
+        keys = {self._generation_key(label): label for label in labels}
+        found = self.cache.get_many(keys)
+        for key in keys.keys() - found.keys():
+            # A generation evicted by the backend must not restart from a
+            # value that earlier rows were cached with
+            self.cache.add(key, time.time_ns(), None)
+            found[key] = self.cache.get(key)
+        return {label: found[key] for key, label in keys.items()}
+
+    def bump(self, label: str):
+        key = self._generation_key(label)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, time.time_ns(), None)
+
+
+def _related_labels(
+    model: Type[Model], transforms: Iterable[InstanceTransform], labels: Set[str]
+):
+    """
+    Collect the labels of the models reached by the relations of ``transforms``.
+    """
+    for transform in compile_transforms(model, transforms):
+        compile = getattr(transform, "compile", None)
+        if compile is None:
+            continue
+        for entry in compile(model):
+            if not isinstance(entry.transform, _Relation):
+                continue
+            field = model_fields(model).get(entry.name)
+            related_model = getattr(field, "related_model", None)
+            if related_model is None:
+                continue
+            label = _label(related_model)
+            if label not in labels:
+                labels.add(label)
+                _related_labels(related_model, entry.transform.transforms, labels)
+
+
+def _version_attname(cache: RowCache, model: Type[Model]) -> Optional[str]:
+    if cache.version_field is None:
+        return None
+    field = model_fields(model).get(cache.version_field)
+    return (
+        getattr(field, "attname", None) if getattr(field, "concrete", False) else None
+    )
+
+
+def _stable_repr(value: Any) -> str:
+    """
+    A representation of a transform tree that is the same in every process.
+    Custom callables are represented by their import paths, so only module
+    level functions, and objects with a repr of their own, can be cached.
+    """
+    if isinstance(value, _Spec):
+        args = ", ".join(
+            _stable_repr(getattr(value, field.name))
+            for field in dataclasses.fields(value)
+        )
+        return f"{type(value).__qualname__}({args})"
+    if isinstance(value, tuple):
+        return f"({''.join(_stable_repr(item) + ', ' for item in value)})"
+    if isinstance(value, (FunctionType, BuiltinFunctionType)):
+        qualname = value.__qualname__
+        if "<" not in qualname and not getattr(value, "__closure__", None):
+            return f"{value.__module__}.{qualname}"
+    elif not callable(value) or type(value).__repr__ is not object.__repr__:
+        return repr(value)
+    raise ValueError(
+        f"Rows of {value!r} can't be cached, use a module level function instead"
+    )
+
+
+def _key_prefix(
+    cache: RowCache,
+    model: Type[Model],
+    transforms: Tuple[InstanceTransform, ...],
+    versioned: bool,
+) -> str:
+    labels: Set[str] = set()
+    _related_labels(model, transforms, labels)
+    if not versioned:
+        labels.add(_label(model))
+    generations = sorted(cache.generations(labels).items())
+    spec = repr((_label(model), _stable_repr(transforms), generations))
+    return hashlib.sha1(spec.encode()).hexdigest()
+
+
+def _cached_queryset(
+    qs: QuerySet,
+    transforms: Tuple[InstanceTransform, ...],
+    cache: RowCache,
+    memo: Optional[str],
+) -> List[Value]:
+    model = qs.model
+    attname = _version_attname(cache, model)
+    prefix = _key_prefix(cache, model, transforms, attname is not None)
+
+    columns = ("pk",) if attname is None else ("pk", attname)
+    keys = [
+        (prefix, row[0], row[1] if attname else None)
+        for row in qs.prefetch_related(None).values_list(*columns)
+    ]
+    rows = cache.get_many(keys)
+    missing = {key[1]: key for key in keys if key not in rows}
+    if missing:
+        missing_qs = qs._chain()
+        missing_qs.query.clear_limits()
+        missing_qs, transforms, loaders = _prepare(
+            missing_qs.order_by(), transforms, memo
+        )
+        batch_size = connections[qs.db].features.max_query_params or len(missing)
+        serialized = {}
+        for batch in _chunks(missing, max(batch_size, 1)):
+            instances = list(missing_qs.filter(pk__in=batch))
+            for instance, row in zip(
+                instances, _serialize_chunk(instances, transforms, loaders)
+            ):
+                key = missing[instance.pk]
+                if attname is not None:
+                    # The row may have changed since its key was read
+                    key = (prefix, instance.pk, getattr(instance, attname))
+                serialized[key] = rows[missing[instance.pk]] = row
+        cache.set_many(serialized)
+
+    return [rows[key] for key in keys if key in rows]
+
+
+def _cached_instances(
+    instances: List[Model],
+    transforms: Tuple[InstanceTransform, ...],
+    cache: RowCache,
+) -> List[Value]:
+    if not instances:
+        return []
+
+    model = instances[0].__class__
+    attname = _version_attname(cache, model)
+    prefix = _key_prefix(cache, model, transforms, attname is not None)
+    keys = [
+        (prefix, instance.pk, getattr(instance, attname) if attname else None)
+        for instance in instances
+    ]
+    rows = cache.get_many(keys)
+    missing = [
+        (key, instance) for key, instance in zip(keys, instances) if key not in rows
+    ]
+    if missing:
+        compiled = compile_transforms(model, transforms)
+        serialized = dict(
+            zip(
+                (key for key, _ in missing),
+                _serialize_chunk([instance for _, instance in missing], compiled, ()),
+            )
+        )
+        cache.set_many(serialized)
+        rows.update(serialized)
+    return [rows[key] for key in keys]
+
+
+def cached_qs_to_list(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    cache: RowCache,
+    memo: Optional[str] = None,
+) -> List[Value]:
+    """
+    Serialize ``qs`` serving the rows found in ``cache`` from there.
+
+    An unevaluated queryset is first read as primary keys and version tokens,
+    and only the rows missing from the cache are fetched with their relations
+    and serialized. Evaluated querysets and lists of instances are looked up
+    instance by instance.
+    """
+    transforms = tuple(transforms)
+    if isinstance(qs, QuerySet) and _values_qs(qs):
+        return _cached_queryset(qs, transforms, cache, memo)
+    return _cached_instances(list(qs), transforms, cache)
@@ -0,0 +1,186 @@
+import datetime
+from array import array
+from itertools import chain
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Mapping,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from django.db.models import (
+    BooleanField,
+    DateField,
+    DateTimeField,
+    DecimalField,
+    Field,
+    FloatField,
+    IntegerField,
+    QuerySet,
+)
+
+from .qscruncher import (
+    InstanceTransform,
+    _flat_columns,
+    _qs_to_iter,
+    _values_qs,
+    compile_transforms,
+)
+
+COLUMN_OUTPUTS = ("list", "array", "numpy")
+
+# Typed array typecodes and NumPy dtypes of field types, most specific first
+_ARRAY_TYPECODES = ((BooleanField, "b"), (IntegerField, "q"), (FloatField, "d"))
+_NUMPY_DTYPES = (
+    (BooleanField, "bool"),
+    (IntegerField, "int64"),
+    (FloatField, "float64"),
+    # Decimals are kept exact unless mapped otherwise with dtypes
+    (DecimalField, "object"),
+    (DateTimeField, "datetime64[us]"),
+    (DateField, "datetime64[D]"),
+)
+
+
+def _column_field(model, attname: str) -> Optional[Field]:
+    for field in model._meta.concrete_fields:
+        if field.attname == attname:
+            # Foreign key columns hold values of the field they refer to
+            while field.is_relation and not field.null:
+                field = field.target_field
+            return field
+    return None
+
+
+def _default_type(field: Optional[Field], output: str) -> Optional[str]:
+    if field is None or field.null:
+        return None
+    types = _ARRAY_TYPECODES if output == "array" else _NUMPY_DTYPES
+    for field_class, column_type in types:
+        if isinstance(field, field_class):
+            return column_type
+    return None
+
+
+def _naive_utc(value):
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _empty_column(output: str, column_type: Optional[str]):
+    if output == "array" and column_type is not None:
+        return array(column_type)
+    return []
+
+
+def _to_column(values: MutableSequence[Any], output: str, column_type: Optional[str]):
+    if output != "numpy":
+        return values
+
+    import numpy
+
+    if column_type is None:
+        column_type = "object"
+    if column_type.startswith("datetime64"):
+        # NumPy has no time zones, so aware datetimes are stored in UTC
+        values = [_naive_utc(value) for value in values]
+    if column_type == "object":
+        column = numpy.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+    return numpy.fromiter(values, dtype=column_type, count=len(values))
+
+
+def _planned_attnames(
+    model, transforms: Tuple[InstanceTransform, ...]
+) -> Dict[str, Optional[str]]:
+    """
+    The names of the plan entries of ``transforms`` in order, with the
+    attnames of the ones read as is.
+    """
+    attnames: Dict[str, Optional[str]] = {}
+    if model is not None:
+        for transform in compile_transforms(model, transforms):
+            compile = getattr(transform, "compile", None)
+            if compile is not None:
+                attnames.update((entry.name, entry.attname) for entry in compile(model))
+    return attnames
+
+
+def _column_rows(
+    qs, transforms: Tuple[InstanceTransform, ...], chunk_size: int
+) -> Tuple[Tuple[str, ...], Iterable[Sequence[Any]], Tuple[Optional[Field], ...]]:
+    """
+    The column names, an iterable of rows as sequences of values in the
+    order of the names, and the fields whose types the columns follow.
+    """
+    model = getattr(qs, "model", None)
+    if _values_qs(qs) and (
+        columns := _flat_columns(qs.model, compile_transforms(qs.model, transforms))
+    ):
+        names, attnames = columns
+        rows = qs.prefetch_related(None).values_list(*attnames)
+        fields = tuple(_column_field(model, attname) for attname in attnames)
+        return names, rows.iterator(chunk_size=chunk_size), fields
+
+    # Only the columns read as is follow the types of their fields
+    attnames = _planned_attnames(model, transforms)
+    rows = _qs_to_iter(qs, transforms, chunk_size, None)
+    first = next(rows, None)
+    if first is None:
+        # Without rows the columns are the ones the plans would have written
+        names = tuple(attnames)
+    else:
+        names = tuple(first)
+        rows = chain((first,), rows)
+    fields = tuple(
+        _column_field(model, attnames[name]) if attnames.get(name) else None
+        for name in names
+    )
+    return names, (map(row.get, names) for row in rows), fields
+
+
+def qs_to_columns(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    output: str = "list",
+    dtypes: Optional[Mapping[str, str]] = None,
+    chunk_size: int = 2000,
+) -> Dict[str, Any]:
+    """
+    Serialize ``qs`` into a dict of columns keyed by the output names.
+
+    Transforms that only read plain columns are read straight from
+    values_list tuples, others are serialized into rows first. With
+    ``output="list"`` the columns are lists, with ``array`` typed arrays for
+    non-null boolean, integer and float fields and lists otherwise, and with
+    ``numpy`` NumPy arrays whose dtypes follow the field types. ``dtypes``
+    overrides the typecode or dtype of the named columns.
+
+    The queryset is fetched ``chunk_size`` rows at a time, and the values are
+    appended to their columns as they are read.
+    """
+    if output not in COLUMN_OUTPUTS:
+        raise ValueError(f"output must be one of {', '.join(COLUMN_OUTPUTS)}")
+
+    names, rows, fields = _column_rows(qs, tuple(transforms), chunk_size)
+    dtypes = dtypes or {}
+    column_types = [
+        dtypes[name] if name in dtypes else _default_type(field, output)
+        for name, field in zip(names, fields)
+    ]
+    columns = [_empty_column(output, column_type) for column_type in column_types]
+    appends = [column.append for column in columns]
+    for row in rows:
+        for append, value in zip(appends, row):
+            append(value)
+
+    return {
+        name: _to_column(column, output, column_type)
+        for name, column, column_type in zip(names, columns, column_types)
+    }
@@ -0,0 +1,177 @@
+from collections import namedtuple
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Callable, Iterable, List, Optional, Tuple, Type, Union
+
+from django.db.models import Model, QuerySet
+
+from .qscruncher import (
+    FieldTransform,
+    InstanceTransform,
+    Ref,
+    Refs,
+    _check_deferred_fields,
+    _check_relation_caching,
+    _flat_columns,
+    _relation_check_skipper,
+    _values_qs,
+    compile_transforms,
+    model_fields,
+    rewrite_field_transforms,
+)
+
+# The names of a compact row, where nested relations are (name, header) pairs
+Header = Tuple[Union[str, Tuple[str, Any]], ...]
+RowFactory = Callable[[Model], Any]
+
+
+def _make_record(names: Tuple[str, ...], values: Tuple[Any, ...]):
+    return record_type(names)._make(values)
+
+
+@lru_cache(maxsize=1024)
+def record_type(names: Tuple[str, ...]) -> Type[tuple]:
+    """
+    The record class of rows with ``names``: a named tuple without per
+    instance dicts that pickles without being importable.
+    """
+    base = namedtuple("Record", names, rename=True)
+    return type(
+        "Record",
+        (base,),
+        {
+            "__slots__": (),
+            "__reduce__": lambda self: (_make_record, (names, tuple(self))),
+        },
+    )
+
+
+def _header_names(header: Header) -> Tuple[str, ...]:
+    return tuple(name if isinstance(name, str) else name[0] for name in header)
+
+
+def _field_getter(field_transform: FieldTransform, name: str) -> RowFactory:
+    def get(instance: Model):
+        data: dict = {}
+        field_transform(instance, name, data)
+        return data[name]
+
+    return get
+
+
+def _ref_getter(relation: Ref, name: str, row: RowFactory) -> RowFactory:
+    def get(instance: Model):
+        relation_instance = relation._relation_instance(instance, name)
+        return None if relation_instance is None else row(relation_instance)
+
+    return get
+
+
+def _refs_getter(relation: Refs, name: str, row: RowFactory) -> RowFactory:
+    def get(instance: Model):
+        return [
+            row(related) for related in relation._relation_instances(instance, name)
+        ]
+
+    return get
+
+
+def _compact_row(
+    model: Type[Model], transforms: Iterable[InstanceTransform], records: bool
+) -> Tuple[Optional[Header], RowFactory]:
+    """
+    Compile ``transforms`` into the header and the factory of compact rows.
+    A lone transform without a plan, such as pk(), produces its value as is
+    and has no header.
+    """
+    compiled = compile_transforms(model, transforms)
+    compile = getattr(compiled[0], "compile", None) if len(compiled) == 1 else None
+    if compile is None:
+        if len(compiled) == 1:
+            transform = compiled[0]
+            return None, lambda instance: transform(instance, {})
+        raise ValueError(
+            "Compact rows require the transforms to be field selections,"
+            " eg. fields() or all_fields()"
+        )
+
+    header = []
+    getters = []
+    for name, attname, field_transform in compile(model):
+        if field_transform is None:
+            header.append(name)
+            getters.append(attrgetter(attname))
+            continue
+
+        related_model = getattr(model_fields(model).get(name), "related_model", None)
+        if isinstance(field_transform, (Ref, Refs)) and related_model is not None:
+            nested_header, row = _compact_row(
+                related_model, field_transform.transforms, records
+            )
+            header.append(name if nested_header is None else (name, nested_header))
+            getter = _refs_getter if field_transform.many else _ref_getter
+            getters.append(getter(field_transform, name, row))
+        else:
+            header.append(name)
+            getters.append(_field_getter(field_transform, name))
+
+    header = tuple(header)
+    getters = tuple(getters)
+    if records:
+        make = record_type(_header_names(header))._make
+        return header, lambda instance: make([get(instance) for get in getters])
+    return header, lambda instance: tuple([get(instance) for get in getters])
+
+
+def _compact_rows(
+    qs: QuerySet, transforms: Iterable[InstanceTransform], records: bool
+) -> Tuple[Header, List[Any]]:
+    transforms = tuple(transforms)
+    model = getattr(qs, "model", None)
+    if model is None:
+        qs = list(qs)
+        if not qs:
+            return (), []
+        model = qs[0].__class__
+
+    if _values_qs(qs) and (
+        columns := _flat_columns(model, compile_transforms(model, transforms))
+    ):
+        names, attnames = columns
+        rows = qs.prefetch_related(None).values_list(*attnames)
+        if records:
+            return names, list(map(record_type(names)._make, rows))
+        return names, list(rows)
+
+    if isinstance(qs, QuerySet):
+        transforms = compile_transforms(model, transforms)
+        _check_deferred_fields(qs, transforms)
+        if caching := _check_relation_caching(qs, transforms):
+            transforms = rewrite_field_transforms(
+                model, transforms, _relation_check_skipper(caching)
+            )
+    header, row = _compact_row(model, transforms, records)
+    return header, [row(instance) for instance in qs]
+
+
+def qs_to_tuples(
+    qs: QuerySet, transforms: Iterable[InstanceTransform]
+) -> Tuple[Header, List[tuple]]:
+    """
+    Serialize ``qs`` into tuples that share a header of the field names.
+    Relations read with ref() and refs() are tuples too, and appear in the
+    header as ``(name, nested header)`` pairs.
+
+    The transforms must compile into a single field selection, and relations
+    are read from the select_related and prefetch_related caches of ``qs``.
+    """
+    return _compact_rows(qs, transforms, False)
+
+
+def qs_to_records(qs: QuerySet, transforms: Iterable[InstanceTransform]) -> List[tuple]:
+    """
+    Serialize ``qs`` into records, named tuples generated per compiled plan
+    that are read by attribute, eg. ``row.foreign_key.id``. Otherwise works
+    like qs_to_tuples.
+    """
+    return _compact_rows(qs, transforms, True)[1]
@@ -0,0 +1,49 @@
+import dataclasses
+from typing import Any, Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+
+@dataclasses.dataclass(frozen=True)
+class Config:
+    """
+    The QSCRUNCHER_ settings, resolved once and refreshed when they change.
+    """
+
+    # A signal sent with ``msg`` when an uncached relation is encountered
+    uncached_relation_signal: Optional[Any] = None
+    uncached_relation_no_warn: bool = False
+    uncached_relation_no_raise: bool = False
+
+
+_config: Optional[Config] = None
+
+
+def get_config() -> Config:
+    config = _config
+    if config is None:
+        config = _load()
+    return config
+
+
+def _load() -> Config:
+    global _config
+    _config = Config(
+        **{
+            field.name: getattr(
+                settings, f"QSCRUNCHER_{field.name.upper()}", field.default
+            )
+            for field in dataclasses.fields(Config)
+        }
+    )
+    return _config
+
+
+def _settings_changed(setting, **kwargs):
+    global _config
+    if setting.startswith("QSCRUNCHER_"):
+        _config = None
+
+
+setting_changed.connect(_settings_changed)
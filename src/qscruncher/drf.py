@@ -0,0 +1,292 @@
+import dataclasses
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
+
+from django.db.models import Model, QuerySet, prefetch_related_objects
+from django.db.models.manager import BaseManager
+from rest_framework.fields import (
+    BigIntegerField,
+    BooleanField,
+    CharField,
+    Field,
+    FloatField,
+    IntegerField,
+    ReadOnlyField,
+    SkipField,
+)
+from rest_framework.relations import (
+    ManyRelatedField,
+    PKOnlyObject,
+    PrimaryKeyRelatedField,
+)
+from rest_framework.serializers import (
+    BaseSerializer,
+    ListSerializer,
+    ModelSerializer,
+    Serializer,
+)
+from rest_framework.settings import api_settings
+from rest_framework.utils.field_mapping import ClassLookupDict
+
+from .optimizer import Lookups, _collect_lookups, optimize
+from .qscruncher import (
+    Fields,
+    InstanceTransform,
+    Value,
+    model_fields,
+    qs_to_list,
+    ref,
+    refs,
+)
+
+# The to_representation methods that return the values of model fields as is
+_AS_IS = tuple(
+    field_class.to_representation
+    for field_class in (
+        BooleanField,
+        CharField,
+        FloatField,
+        IntegerField,
+        ReadOnlyField,
+    )
+)
+
+# Path of serializer field names from the serialized class to a field
+FieldPath = Tuple[str, ...]
+
+# The bound serializer fields of the fallbacks of the current call
+_fallback_fields: ContextVar[Dict[FieldPath, Field]] = ContextVar(
+    "qscruncher_drf_fallback_fields"
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class _Fallback:
+    """
+    A serializer field that isn't compiled, represented by the field itself.
+    With ``attname`` the value is read straight off the instance.
+    """
+
+    path: FieldPath
+    attname: Optional[str] = None
+
+    def __call__(self, instance: Model, name: str, data: dict):
+        field = _fallback_fields.get()[self.path]
+        if self.attname is not None:
+            attribute = getattr(instance, self.attname)
+        else:
+            try:
+                attribute = field.get_attribute(instance)
+            except SkipField:
+                return
+
+        if isinstance(attribute, PKOnlyObject):
+            data[name] = (
+                None if attribute.pk is None else field.to_representation(attribute)
+            )
+        else:
+            data[name] = (
+                None if attribute is None else field.to_representation(attribute)
+            )
+
+
+def _as_is(serializer: ModelSerializer, field: Field, model_field) -> bool:
+    if type(field) is ReadOnlyField:
+        return True
+    # Declared fields of other types coerce the values of the model field
+    try:
+        mapped = ClassLookupDict(serializer.serializer_field_mapping)[model_field]
+    except KeyError:
+        return False
+    if type(field) is not mapped:
+        return False
+
+    if isinstance(field, BigIntegerField):
+        # Big integers are strings when coerced, eg. for JavaScript clients
+        return not getattr(
+            field, "coerce_to_string", api_settings.COERCE_BIGINT_TO_STRING
+        )
+    return type(field).to_representation in _AS_IS
+
+
+def _plain_representation(serializer: Serializer) -> bool:
+    return type(serializer).to_representation is Serializer.to_representation or (
+        isinstance(serializer, ListSerializer)
+        and type(serializer).to_representation
+        in (ListSerializer.to_representation, CrunchedListSerializer.to_representation)
+    )
+
+
+def _nested_transform(
+    serializer: Serializer, model_field, path: FieldPath, fallbacks: List[FieldPath]
+) -> Optional[Any]:
+    many = isinstance(serializer, ListSerializer)
+    child = serializer.child if many else serializer
+    if not (
+        isinstance(child, ModelSerializer)
+        and _plain_representation(serializer)
+        and _plain_representation(child)
+        and child.Meta.model is model_field.related_model
+    ):
+        return None
+
+    if many and (model_field.many_to_many or model_field.one_to_many):
+        return refs(_compile(child, path, fallbacks))
+    if not many and model_field.concrete and model_field.is_relation:
+        return ref(_compile(child, path, fallbacks))
+    return None
+
+
+def _compile(
+    serializer: Serializer, prefix: FieldPath, fallbacks: List[FieldPath]
+) -> InstanceTransform:
+    """
+    Compile the readable fields of ``serializer`` into a field selection,
+    collecting the paths of the fields that fall back to DRF into ``fallbacks``.
+    """
+    _model_fields = model_fields(serializer.Meta.model)
+    names = []
+    kwargs = {}
+    for field in serializer._readable_fields:
+        name = field.field_name
+        path = (*prefix, name)
+        names.append(name)
+
+        model_field = _model_fields.get(name) if field.source == name else None
+        if model_field is not None:
+            if isinstance(field, BaseSerializer):
+                transform = _nested_transform(field, model_field, path, fallbacks)
+                if transform is not None:
+                    kwargs[name] = transform
+                    continue
+            elif not model_field.is_relation:
+                if _as_is(serializer, field, model_field):
+                    continue
+                fallbacks.append(path)
+                kwargs[name] = _Fallback(path, model_field.attname)
+                continue
+            # Primary keys of relations are what plain relation fields produce
+            elif isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+                if model_field.concrete and not model_field.many_to_many:
+                    continue
+            elif (
+                isinstance(field, ManyRelatedField)
+                and isinstance(field.child_relation, PrimaryKeyRelatedField)
+                and field.child_relation.pk_field is None
+            ):
+                if model_field.many_to_many or model_field.one_to_many:
+                    continue
+
+        fallbacks.append(path)
+        kwargs[name] = _Fallback(path)
+    return Fields(tuple(names), tuple(kwargs.items()))
+
+
+# Serializer fields by name, with the fields of nested serializers
+FieldNames = Tuple[Union[str, Tuple[str, "FieldNames"]], ...]
+
+
+def _field_names(serializer: Serializer) -> FieldNames:
+    names: List[Union[str, Tuple[str, FieldNames]]] = []
+    for field in serializer._readable_fields:
+        nested = field.child if isinstance(field, ListSerializer) else field
+        if isinstance(nested, Serializer):
+            names.append((field.field_name, _field_names(nested)))
+        else:
+            names.append(field.field_name)
+    return tuple(names)
+
+
+_compiled: Dict[
+    Tuple[Type[Serializer], FieldNames], Tuple[InstanceTransform, Tuple[FieldPath, ...]]
+] = {}
+
+
+def compile_serializer(
+    serializer: Serializer,
+) -> Tuple[InstanceTransform, Tuple[FieldPath, ...]]:
+    """
+    The transform equivalent to ``serializer`` and the paths of the fields it
+    falls back to DRF for, compiled once per serializer class and set of
+    readable fields, which serializers may pick per instance.
+    """
+    key = (type(serializer), _field_names(serializer))
+    try:
+        return _compiled[key]
+    except KeyError:
+        fallbacks: List[FieldPath] = []
+        transform = _compile(serializer, (), fallbacks)
+        compiled = _compiled[key] = (transform, tuple(fallbacks))
+        return compiled
+
+
+def _bound_fields(
+    serializer: Serializer, paths: Tuple[FieldPath, ...]
+) -> Dict[FieldPath, Field]:
+    bound = {}
+    for path in paths:
+        field = serializer
+        for name in path:
+            if isinstance(field, ListSerializer):
+                field = field.child
+            field = field.fields[name]
+        bound[path] = field
+    return bound
+
+
+def _load_relations(
+    instances: List[Model], model: Type[Model], transform: InstanceTransform
+) -> None:
+    lookups = Lookups([], [], [])
+    _collect_lookups(model, (transform,), "", lookups)
+    if instances and (lookups.select_related or lookups.prefetch_related):
+        prefetch_related_objects(
+            instances, *lookups.select_related, *lookups.prefetch_related
+        )
+
+
+class CrunchedListSerializer(ListSerializer):
+    """
+    A ListSerializer that serializes with the compiled transform of its child
+    serializer. Unevaluated querysets are optimized with the joins and
+    prefetches the transform needs, lists of instances get them prefetched.
+    """
+
+    def to_representation(self, data) -> List[Value]:
+        if not (
+            isinstance(self.child, ModelSerializer)
+            and _plain_representation(self.child)
+        ):
+            return super().to_representation(data)
+
+        transform, paths = compile_serializer(self.child)
+        iterable = data.all() if isinstance(data, BaseManager) else data
+        if isinstance(iterable, QuerySet) and iterable._result_cache is None:
+            iterable = optimize(iterable, (transform,))
+        else:
+            iterable = list(iterable)
+            _load_relations(iterable, self.child.Meta.model, transform)
+
+        token = _fallback_fields.set(_bound_fields(self.child, paths))
+        try:
+            return qs_to_list(iterable, (transform,))
+        finally:
+            _fallback_fields.reset(token)
+
+
+class CrunchedModelSerializer(ModelSerializer):
+    """
+    A ModelSerializer that is serialized with qscruncher when ``many=True``.
+
+    The serializer is compiled into a transform once per class and set of
+    readable fields, on first use: fields that read model columns as is,
+    primary key related fields and nested model serializers are compiled,
+    and the rest fall back to their own ``to_representation`` one field at
+    a time.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        meta = getattr(cls, "Meta", None)
+        if meta is not None and not hasattr(meta, "list_serializer_class"):
+            meta.list_serializer_class = CrunchedListSerializer
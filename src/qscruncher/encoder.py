@@ -0,0 +1,274 @@
+import datetime
+import math
+import uuid
+from decimal import Decimal
+from json.encoder import encode_basestring
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Model, QuerySet
+
+from .loader import RelationLoader
+from .qscruncher import (
+    InstanceTransform,
+    Plan,
+    _active_profile,
+    _chunks,
+    _flat_columns,
+    _instance_chunks,
+    _prepare,
+    _Relation,
+    _run_plan,
+    _values_qs,
+    compile_transforms,
+    instance_to_value,
+)
+
+Output = Union[bytearray, Any]
+
+_django_default = DjangoJSONEncoder().default
+
+
+def _encode_float(value: float) -> str:
+    if math.isfinite(value):
+        return float.__repr__(value)
+    if value != value:
+        return "NaN"
+    return "Infinity" if value > 0 else "-Infinity"
+
+
+def _encode_django(value: Any) -> str:
+    return encode_basestring(_django_default(value))
+
+
+_encoders: Dict[type, Callable[[Any], str]] = {
+    str: encode_basestring,
+    int: int.__repr__,
+    float: _encode_float,
+    bool: lambda value: "true" if value else "false",
+    type(None): lambda value: "null",
+    Decimal: _encode_django,
+    datetime.datetime: _encode_django,
+    datetime.date: _encode_django,
+    datetime.time: _encode_django,
+    datetime.timedelta: _encode_django,
+    uuid.UUID: _encode_django,
+}
+
+
+def _encode(value: Any, parts: List[str]):
+    encoder = _encoders.get(value.__class__)
+    if encoder is not None:
+        parts.append(encoder(value))
+    elif isinstance(value, dict):
+        separator = "{"
+        for key, item in value.items():
+            parts.append(separator)
+            parts.append(encode_basestring(str(key)))
+            parts.append(":")
+            _encode(item, parts)
+            separator = ","
+        parts.append("}" if separator == "," else "{}")
+    elif isinstance(value, (list, tuple)):
+        separator = "["
+        for item in value:
+            parts.append(separator)
+            _encode(item, parts)
+            separator = ","
+        parts.append("]" if separator == "," else "[]")
+    else:
+        for _type, encoder in _encoders.items():
+            if isinstance(value, _type):
+                parts.append(encoder(value))
+                return
+        # Raises TypeError for anything DjangoJSONEncoder can't handle either
+        parts.append(_encode_django(value))
+
+
+def _key_prefixes(names: Iterable[str]) -> Tuple[str, ...]:
+    """
+    Precompute the ``{"name":`` / ``,"name":`` fragments written before each value.
+    """
+    return tuple(
+        ("," if index else "{") + encode_basestring(name) + ":"
+        for index, name in enumerate(names)
+    )
+
+
+# Field transforms that always write exactly their own key and read no
+# other keys of the row, so their values can be encoded one at a time
+_OWN_KEY_TRANSFORMS = (_Relation, RelationLoader)
+
+
+def _encode_plan(instance: Model, plan: Plan, prefixes: Tuple[str, ...], parts):
+    if not plan:
+        parts.append("{}")
+        return
+
+    for prefix, (name, attname, field_transform) in zip(prefixes, plan):
+        parts.append(prefix)
+        if field_transform is None:
+            _encode(getattr(instance, attname), parts)
+        else:
+            data = {}
+            field_transform(instance, name, data)
+            _encode(data[name], parts)
+    parts.append("}")
+
+
+def _instance_encoder(
+    transforms: Tuple[InstanceTransform, ...],
+) -> Callable[[Model, List[str]], None]:
+    compile = getattr(transforms[0], "compile", None) if len(transforms) == 1 else None
+    if compile is None:
+        return lambda instance, parts: _encode(
+            instance_to_value(instance, transforms), parts
+        )
+
+    plans: Dict[type, Tuple[Plan, Optional[Tuple[str, ...]]]] = {}
+
+    def encode(instance: Model, parts: List[str]):
+        try:
+            plan, prefixes = plans[instance.__class__]
+        except KeyError:
+            plan = compile(instance.__class__)
+            # Custom field transforms may write other keys, leave their own
+            # out or read the keys written before them, so they need the row
+            if all(
+                entry.transform is None
+                or isinstance(entry.transform, _OWN_KEY_TRANSFORMS)
+                for entry in plan
+            ):
+                prefixes = _key_prefixes(entry.name for entry in plan)
+            else:
+                prefixes = None
+            plans[instance.__class__] = plan, prefixes
+        if prefixes is None:
+            _encode(_run_plan(instance, plan, {}), parts)
+        else:
+            _encode_plan(instance, plan, prefixes, parts)
+
+    return encode
+
+
+def _encode_rows(
+    rows: Iterable[Tuple[Any, ...]],
+    prefixes: Tuple[str, ...],
+    parts,
+    separator: str = ",",
+):
+    for row in rows:
+        parts.append(separator)
+        for prefix, value in zip(prefixes, row):
+            parts.append(prefix)
+            encoder = _encoders.get(value.__class__)
+            if encoder is None:
+                _encode(value, parts)
+            else:
+                parts.append(encoder(value))
+        parts.append("}" if prefixes else "{}")
+
+
+def _writer(out: Output) -> Callable[[bytes], Any]:
+    write = getattr(out, "write", None)
+    return write if write is not None else out.extend
+
+
+def qs_to_json_stream(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    out: Output,
+    chunk_size: int = 2000,
+):
+    """
+    Serialize ``qs`` as a JSON array into ``out``, which is either a bytearray
+    or a binary file-like object. Values are encoded straight off the instances
+    (or values_list rows) without building the row dictionaries first, and
+    the output is written once per chunk of ``chunk_size`` rows.
+
+    Decimals, dates, times, durations and UUIDs are encoded the same way as
+    DjangoJSONEncoder encodes them.
+    """
+    stats = _active_profile.get()
+    if stats is None:
+        _qs_to_json_stream(qs, transforms, out, chunk_size)
+        return
+
+    from .profiling import record
+
+    stats.calls += 1
+    with record(stats, qs):
+        stats.rows += _qs_to_json_stream(qs, transforms, out, chunk_size)
+
+
+def _encoded_chunks(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    chunk_size: int,
+    separator: str = ",",
+) -> Iterator[Tuple[int, List[str]]]:
+    """
+    Encode ``qs`` chunk by chunk, yielding the number of rows and the JSON
+    fragments of each chunk. Every row is preceded by ``separator``.
+    """
+    model = getattr(qs, "model", None)
+    if model is not None:
+        transforms = compile_transforms(model, transforms)
+    else:
+        transforms = tuple(transforms)
+
+    if _values_qs(qs) and (columns := _flat_columns(model, transforms)):
+        names, attnames = columns
+        prefixes = _key_prefixes(names)
+        rows = qs.prefetch_related(None).values_list(*attnames)
+        for chunk in _chunks(rows.iterator(chunk_size=chunk_size), chunk_size):
+            parts: List[str] = []
+            _encode_rows(chunk, prefixes, parts, separator)
+            yield len(chunk), parts
+        return
+
+    loaders = ()
+    if isinstance(qs, QuerySet) and qs._result_cache is None:
+        qs, transforms, loaders = _prepare(qs, transforms)
+        chunks = _instance_chunks(qs, chunk_size)
+    else:
+        chunks = _chunks(qs, chunk_size)
+    encode_instance = _instance_encoder(transforms)
+
+    for chunk in chunks:
+        for loader in loaders:
+            loader.load(chunk)
+        parts = []
+        for instance in chunk:
+            parts.append(separator)
+            encode_instance(instance, parts)
+        yield len(chunk), parts
+
+
+def _qs_to_json_stream(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    out: Output,
+    chunk_size: int,
+) -> int:
+    write = _writer(out)
+    write(b"[")
+
+    rows = 0
+    for chunk_rows, parts in _encoded_chunks(qs, transforms, chunk_size):
+        if not rows:
+            # Drop the separator in front of the very first row
+            parts[0] = ""
+        rows += chunk_rows
+        write("".join(parts).encode())
+
+    write(b"]")
+    return rows
+
+
+def qs_to_json_bytes(
+    qs: QuerySet, transforms: Iterable[InstanceTransform], chunk_size: int = 2000
+) -> bytes:
+    out = bytearray()
+    qs_to_json_stream(qs, transforms, out, chunk_size=chunk_size)
+    return bytes(out)
@@ -0,0 +1,217 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+from django.db import connections
+from django.db.models import Manager, Model, Prefetch, QuerySet
+
+from .qscruncher import (
+    InstanceTransform,
+    Pk,
+    PlanEntry,
+    Refs,
+    Value,
+    _chunks,
+    _flat_columns,
+    _plan_runner,
+    compile_transforms,
+    model_fields,
+    model_meta,
+)
+
+
+class RelationLoader:
+    """
+    Loads a refs() relation for a chunk of parent instances with a single
+    values_list query and serves the serialized rows as a field transform.
+    Without ``names`` the relation is loaded as a list of plain values of the
+    single column in ``attnames``.
+    """
+
+    def __init__(
+        self,
+        qs: QuerySet,
+        lookup: str,
+        names: Optional[Tuple[str, ...]],
+        attnames: Tuple[str, ...],
+    ):
+        self.qs = qs
+        self.lookup = lookup
+        self.names = names
+        self.attnames = attnames
+        self.loaded: Dict[Any, List[Value]] = {}
+
+    def load(self, instances: Sequence[Model]):
+        loaded: Dict[Any, List[Value]] = {}
+        names = self.names
+        batch_size = connections[self.qs.db].features.max_query_params or len(instances)
+        pks = [instance.pk for instance in instances]
+        for batch in _chunks(pks, max(batch_size, 1)):
+            rows = self.qs.filter(**{f"{self.lookup}__in": batch}).values_list(
+                self.lookup, *self.attnames
+            )
+            for row in rows:
+                try:
+                    relations = loaded[row[0]]
+                except KeyError:
+                    relations = loaded[row[0]] = []
+                relations.append(row[1] if names is None else dict(zip(names, row[1:])))
+        self.loaded = loaded
+
+    def __call__(self, instance: Model, name: str, data: dict):
+        data[name] = self.loaded.get(instance.pk, [])
+
+
+def _relation_lookup(model, field) -> Optional[str]:
+    """
+    The lookup from the related model back to ``model``, if ``field`` is a
+    many relation that refers to the primary key of ``model``.
+    """
+    if field.many_to_many and field.concrete:
+        if field.m2m_target_field_name() != model._meta.pk.name:
+            return None
+        return field.related_query_name()
+
+    if field.one_to_many or field.many_to_many:
+        if field.many_to_many:
+            target_field_name = field.field.m2m_reverse_target_field_name()
+            if target_field_name != model._meta.pk.name:
+                return None
+        elif not field.field.target_field.primary_key:
+            return None
+        return field.field.name
+
+    return None
+
+
+def _plain_manager(model: Type[Model]) -> bool:
+    """
+    Whether the default manager of ``model`` returns every row unfiltered.
+    """
+    manager = model._default_manager
+    return (
+        type(manager).get_queryset is Manager.get_queryset
+        and manager._queryset_class is QuerySet
+    )
+
+
+def _pk_relation_loader(qs: QuerySet, field, lookup: str) -> RelationLoader:
+    """
+    Load a relation of related primary keys. Many-to-many relations are read
+    straight from the through table unless the related model has a default
+    ordering or a default manager that filters its rows, which require
+    joining the related table.
+    """
+    related_model = field.related_model
+    if (
+        field.many_to_many
+        and not related_model._meta.ordering
+        and _plain_manager(related_model)
+    ):
+        m2m_field = field if field.concrete else field.field
+        source, target = m2m_field.m2m_field_name(), m2m_field.m2m_reverse_field_name()
+        if not field.concrete:
+            source, target = target, source
+
+        through = m2m_field.remote_field.through
+        source_field = through._meta.get_field(source)
+        target_field = through._meta.get_field(target)
+        if target_field.target_field.primary_key:
+            return RelationLoader(
+                through._base_manager.using(qs.db),
+                source_field.attname,
+                None,
+                (target_field.attname,),
+            )
+
+    pk_name = related_model._meta.pk.name
+    return RelationLoader(
+        related_model._default_manager.using(qs.db), lookup, None, (pk_name,)
+    )
+
+
+def _lookup_through(lookup) -> Tuple[str, bool]:
+    """
+    The path of a prefetch lookup and whether it's a plain lookup that the
+    native loader can replace.
+    """
+    if isinstance(lookup, Prefetch):
+        return lookup.prefetch_through, (
+            lookup.queryset is None and lookup.prefetch_to == lookup.prefetch_through
+        )
+    return lookup, True
+
+
+def _relation_loader(
+    qs: QuerySet, entry: PlanEntry, lookups: Sequence[Any]
+) -> Optional[RelationLoader]:
+    if not isinstance(entry.transform, Refs):
+        return None
+
+    field = model_fields(qs.model).get(entry.name)
+    if field is None or field.related_model is None:
+        return None
+
+    # Reverse many-to-many relations are prefetched through their accessor
+    accessor = model_meta(qs.model)[entry.name].accessor
+    for lookup in lookups:
+        through, plain = _lookup_through(lookup)
+        if through.startswith(f"{accessor}__") or (through == accessor and not plain):
+            # The relation is prefetched in a way only Django knows to handle
+            return None
+
+    lookup = _relation_lookup(qs.model, field)
+    if lookup is None:
+        return None
+
+    related_model = field.related_model
+    relation_transforms = compile_transforms(related_model, entry.transform.transforms)
+    if len(relation_transforms) == 1 and isinstance(relation_transforms[0], Pk):
+        return _pk_relation_loader(qs, field, lookup)
+
+    columns = _flat_columns(related_model, relation_transforms)
+    if columns is None:
+        return None
+
+    names, attnames = columns
+    return RelationLoader(
+        related_model._default_manager.using(qs.db), lookup, names, attnames
+    )
+
+
+def native_loaders(
+    qs: QuerySet, transforms: Tuple[InstanceTransform, ...]
+) -> Tuple[QuerySet, Tuple[InstanceTransform, ...], Tuple[RelationLoader, ...]]:
+    """
+    Replace the refs() relations of compiled ``transforms`` that only read
+    plain columns of the related model with RelationLoaders. The prefetch
+    lookups made redundant by the loaders are removed from ``qs``.
+    """
+    lookups = qs._prefetch_related_lookups
+    loaders: List[RelationLoader] = []
+    loaded_names = set()
+    loader_transforms: List[InstanceTransform] = []
+    for transform in transforms:
+        compile = getattr(transform, "compile", None)
+        if compile is None:
+            loader_transforms.append(transform)
+            continue
+
+        plan = []
+        for entry in compile(qs.model):
+            loader = _relation_loader(qs, entry, lookups)
+            if loader is None:
+                plan.append(entry)
+            else:
+                loaders.append(loader)
+                loaded_names.add(model_meta(qs.model)[entry.name].accessor)
+                plan.append(PlanEntry(entry.name, None, loader))
+        loader_transforms.append(_plan_runner(tuple(plan)))
+
+    if not loaders:
+        return qs, transforms, ()
+
+    remaining = [
+        lookup for lookup in lookups if _lookup_through(lookup)[0] not in loaded_names
+    ]
+    if len(remaining) != len(lookups):
+        qs = qs.prefetch_related(None).prefetch_related(*remaining)
+    return qs, tuple(loader_transforms), tuple(loaders)
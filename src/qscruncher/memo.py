@@ -0,0 +1,66 @@
+import dataclasses
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.db.models import Model
+
+from .qscruncher import FieldTransform, InstanceTransform, Ref, instance_to_value
+
+MEMO_MODES = ("share", "copy")
+
+
+@dataclasses.dataclass(frozen=True)
+class _MemoizedRef(Ref):
+    """
+    A ref() that serializes each distinct related instance only once per call.
+    """
+
+    memo: Optional[Dict[Tuple[type, Any], Any]] = dataclasses.field(
+        default=None, compare=False, repr=False
+    )
+    copy: bool = False
+
+    def __call__(self, instance: Model, name: str, data: dict):
+        relation_instance = self._relation_instance(instance, name)
+        if relation_instance is None:
+            data[name] = None
+            return
+
+        key = (relation_instance.__class__, relation_instance.pk)
+        try:
+            value = self.memo[key]
+        except KeyError:
+            value = self.memo[key] = instance_to_value(
+                relation_instance, self._compiled(relation_instance.__class__)
+            )
+
+        if self.copy and isinstance(value, dict):
+            value = dict(value)
+        data[name] = value
+
+
+def memoizer(mode: str) -> Callable[[str, FieldTransform], FieldTransform]:
+    """
+    A rewrite for rewrite_field_transforms that memoizes ref() relations.
+
+    With ``share`` every row referring to the same related instance gets the
+    very same serialized value, with ``copy`` each row gets a shallow copy of it.
+    """
+    if mode not in MEMO_MODES:
+        raise ValueError(f"memo must be one of {', '.join(MEMO_MODES)}")
+
+    memos: Dict[Tuple[InstanceTransform, ...], Dict[Tuple[type, Any], Any]] = {}
+
+    def memoize(path: str, field_transform: FieldTransform) -> FieldTransform:
+        if type(field_transform) is not Ref:
+            return field_transform
+
+        # Relations with equal transforms serialize instances the same way
+        memo = memos.setdefault(field_transform.transforms, {})
+        return _MemoizedRef(
+            field_transform.transforms,
+            check=field_transform.check,
+            memo=memo,
+            copy=mode == "copy",
+        )
+
+    return memoize
@@ -0,0 +1,165 @@
+import threading
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Tuple, Type
+
+from django.core.signals import setting_changed
+from django.db.models import Field, ForeignObjectRel, ManyToOneRel, Model
+
+# Field kinds
+CONCRETE = "concrete"
+FOREIGN_KEY = "foreign_key"
+ONE_TO_ONE = "one_to_one"
+MANY_TO_MANY = "many_to_many"
+REVERSE = "reverse"
+# Fields without a column of their own, eg. GenericForeignKey
+VIRTUAL = "virtual"
+
+MODEL_META_MAX_SIZE = 4096
+# Transforms compiled per model, eg. field plans
+COMPILED_MAX_SIZE = 256
+
+
+class FieldMeta(NamedTuple):
+    """
+    The introspected metadata of a model field.
+    """
+
+    field: Any
+    kind: str
+    # The column attribute of concrete fields, eg. ``foreign_key_id``
+    attname: Optional[str]
+    # The attribute the field is read with off an instance
+    accessor: str
+    nullable: bool
+    # The class attribute of the model behind ``accessor``
+    descriptor: Any
+
+
+_ModelMeta = Tuple[Dict[str, Field], Dict[str, FieldMeta], Dict[Any, Any]]
+
+_registry: Dict[Type[Model], _ModelMeta] = {}
+_lock = threading.Lock()
+
+
+def _field_kind(field) -> str:
+    if isinstance(field, ForeignObjectRel):
+        return REVERSE
+    if not field.concrete:
+        return VIRTUAL
+    if field.many_to_many:
+        return MANY_TO_MANY
+    if field.one_to_one:
+        return ONE_TO_ONE
+    if field.many_to_one:
+        return FOREIGN_KEY
+    return CONCRETE
+
+
+def _field_meta(model: Type[Model], field) -> FieldMeta:
+    kind = _field_kind(field)
+    accessor = field.get_accessor_name() if kind == REVERSE else field.name
+    return FieldMeta(
+        field,
+        kind,
+        field.attname if field.concrete else None,
+        accessor,
+        kind == REVERSE or field.null,
+        getattr(model, accessor, None),
+    )
+
+
+def _field_name(field) -> str:
+    # Reverse many-to-many relations are named by their query name
+    if isinstance(field, ManyToOneRel):
+        return field.get_accessor_name()
+    return field.name
+
+
+def _introspect(model: Type[Model]) -> _ModelMeta:
+    fields = {_field_name(field): field for field in model._meta.get_fields()}
+    meta = {name: _field_meta(model, field) for name, field in fields.items()}
+    return fields, meta, {}
+
+
+def _model_meta(model: Type[Model]) -> _ModelMeta:
+    try:
+        return _registry[model]
+    except KeyError:
+        pass
+
+    with _lock:
+        try:
+            return _registry[model]
+        except KeyError:
+            pass
+        # Dynamic models, eg. of tests, are new classes, so the oldest
+        # entries are dropped rather than growing without bounds
+        while len(_registry) >= MODEL_META_MAX_SIZE:
+            del _registry[next(iter(_registry))]
+        meta = _registry[model] = _introspect(model)
+        return meta
+
+
+def model_fields(model: Type[Model]) -> Dict[str, Field]:
+    """
+    The fields of ``model`` keyed by their names, reverse many-to-one
+    relations by their accessor names.
+    """
+    return _model_meta(model)[0]
+
+
+def model_meta(model: Type[Model]) -> Dict[str, FieldMeta]:
+    """
+    The FieldMeta of the fields of ``model``, keyed like model_fields.
+    """
+    return _model_meta(model)[1]
+
+
+def model_compiled(model: Type[Model], key: Any, compile: Callable[[], Any]) -> Any:
+    """
+    The result of ``compile()`` for ``model``, eg. a field plan, remembered
+    under ``key`` along with the metadata it was compiled from.
+    """
+    compiled = _model_meta(model)[2]
+    try:
+        return compiled[key]
+    except KeyError:
+        pass
+
+    value = compile()
+    with _lock:
+        # Specs built per call, eg. by rewrites, are keyed apart every time
+        while len(compiled) >= COMPILED_MAX_SIZE:
+            del compiled[next(iter(compiled))]
+        return compiled.setdefault(key, value)
+
+
+def warm_model_meta(models: Optional[Iterable[Type[Model]]] = None) -> None:
+    """
+    Introspect ``models``, by default every installed model, up front.
+    """
+    if models is None:
+        from django.apps import apps
+
+        models = apps.get_models()
+    for model in models:
+        _model_meta(model)
+
+
+def clear_model_meta(model: Optional[Type[Model]] = None) -> None:
+    """
+    Forget the metadata of ``model``, or of every model, along with the plans
+    compiled for them. Needed when models are changed in place, eg. in tests.
+    """
+    with _lock:
+        if model is None:
+            _registry.clear()
+        else:
+            _registry.pop(model, None)
+
+
+def _installed_apps_changed(setting, **kwargs):
+    if setting == "INSTALLED_APPS":
+        clear_model_meta()
+
+
+setting_changed.connect(_installed_apps_changed)
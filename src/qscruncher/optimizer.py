@@ -0,0 +1,313 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Type
+
+from django.db.models import Model, Prefetch, QuerySet
+
+from .qscruncher import InstanceTransform, model_fields, model_meta
+
+
+class Lookups(NamedTuple):
+    select_related: List[str]
+    prefetch_related: List[Prefetch]
+    only: List[str]
+
+
+def _collect_lookups(
+    model: Type[Model],
+    transforms: Iterable[InstanceTransform],
+    prefix: str,
+    lookups: Lookups,
+) -> bool:
+    """
+    Walk the transforms of ``model`` and gather the joins and columns they read
+    into ``lookups``. Returns False if some transform reads something that can
+    not be known up front, in which case no only() may be applied.
+    """
+    known = True
+    _model_fields = model_fields(model)
+    _model_meta = model_meta(model)
+    for transform in transforms:
+        compile = getattr(transform, "compile", None)
+        if compile is None:
+            known = False
+            continue
+
+        for entry in compile(model):
+            field = _model_fields.get(entry.name)
+            if entry.transform is None:
+                if field is not None and field.concrete:
+                    lookups.only.append(f"{prefix}{entry.name}")
+                else:
+                    known = False
+                continue
+
+            relation_transforms = getattr(entry.transform, "transforms", None)
+            if (
+                relation_transforms is None
+                or field is None
+                or field.related_model is None
+            ):
+                known = False
+                continue
+
+            # Reverse many-to-many relations are named by their query name,
+            # but prefetched through their accessor
+            lookup = f"{prefix}{_model_meta[entry.name].accessor}"
+            if entry.transform.many and (field.many_to_many or field.one_to_many):
+                required = [] if field.many_to_many else [field.field.name]
+                lookups.prefetch_related.append(
+                    Prefetch(
+                        lookup,
+                        queryset=_optimize(
+                            field.related_model._default_manager.all(),
+                            relation_transforms,
+                            required,
+                        ),
+                    )
+                )
+            elif not entry.transform.many and (field.many_to_one or field.one_to_one):
+                lookups.select_related.append(lookup)
+                if field.concrete:
+                    lookups.only.append(lookup)
+                else:
+                    lookups.only.append(f"{lookup}__{field.field.name}")
+                known &= _collect_lookups(
+                    field.related_model, relation_transforms, f"{lookup}__", lookups
+                )
+            else:
+                known = False
+
+    return known
+
+
+def _optimize(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    required: Optional[List[str]] = None,
+) -> QuerySet:
+    lookups = Lookups([], [], list(required or []))
+    known = _collect_lookups(qs.model, transforms, "", lookups)
+
+    if lookups.select_related:
+        qs = qs.select_related(*lookups.select_related)
+
+    seen = {
+        lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+        for lookup in qs._prefetch_related_lookups
+    }
+    prefetches = []
+    for prefetch in lookups.prefetch_related:
+        if prefetch.prefetch_to not in seen:
+            seen.add(prefetch.prefetch_to)
+            prefetches.append(prefetch)
+    if prefetches:
+        qs = qs.prefetch_related(*prefetches)
+
+    if known:
+        qs = qs.only(*(lookups.only or [qs.model._meta.pk.name]))
+    return qs
+
+
+def _joined_paths(
+    model: Type[Model], select_related: dict, prefix: str
+) -> Optional[Dict[str, str]]:
+    """
+    Map the relation paths of a select_related tree to the only() lookups that
+    keep them loadable, or return None if the tree can't be followed.
+    """
+    paths = {}
+    _model_fields = model_fields(model)
+    for name, nested in select_related.items():
+        field = _model_fields.get(name)
+        if field is None or field.related_model is None:
+            return None
+        path = f"{prefix}{name}"
+        paths[path] = path if field.concrete else f"{path}__{field.field.name}"
+        nested_paths = _joined_paths(field.related_model, nested, f"{path}__")
+        if nested_paths is None:
+            return None
+        paths.update(nested_paths)
+    return paths
+
+
+def prune(qs: QuerySet, transforms: Iterable[InstanceTransform]) -> QuerySet:
+    """
+    Restrict the columns fetched by ``qs`` with only() to the ones that
+    ``transforms`` read, including the columns of ref() targets that ``qs``
+    joins with select_related. Unlike optimize() no joins or prefetches are
+    added, and the foreign keys the existing ones need are kept. The queryset
+    is returned as is when the columns can not be known up front.
+    """
+    select_related = qs.query.select_related
+    if select_related is True:
+        return qs
+
+    lookups = Lookups([], [], [])
+    if not _collect_lookups(qs.model, transforms, "", lookups):
+        return qs
+
+    joined = _joined_paths(qs.model, select_related or {}, "")
+    if joined is None:
+        return qs
+    only = [
+        path
+        for path in lookups.only
+        if "__" not in path or path.rpartition("__")[0] in joined
+    ]
+    only.extend(joined.values())
+
+    _model_fields = model_fields(qs.model)
+    for lookup in qs._prefetch_related_lookups:
+        through = lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup
+        name = through.split("__", 1)[0]
+        field = _model_fields.get(name)
+        if field is None or not field.is_relation:
+            return qs
+        if field.concrete and not field.many_to_many:
+            only.append(name)
+
+    return qs.only(*(only or [qs.model._meta.pk.name]))
+
+
+def _cached_lookups(
+    qs: QuerySet, prefix: str, joined: Optional[Set[str]], prefetched: Set[str]
+) -> Optional[Set[str]]:
+    """
+    Gather the relation paths that ``qs`` joins and prefetches. The joins are
+    None when they can't be known, ie. select_related() was used without
+    arguments.
+    """
+
+    def add_joins(select_related: dict, path_prefix: str):
+        for name, nested in select_related.items():
+            joined.add(f"{path_prefix}{name}")
+            add_joins(nested, f"{path_prefix}{name}__")
+
+    select_related = qs.query.select_related
+    if select_related is True:
+        joined = None
+    elif select_related and joined is not None:
+        add_joins(select_related, prefix)
+
+    for lookup in qs._prefetch_related_lookups:
+        if isinstance(lookup, Prefetch):
+            path = lookup.prefetch_through
+            if lookup.prefetch_to != path:
+                # Relations prefetched into to_attr are not cached on the field
+                path = path.rpartition("__")[0]
+        else:
+            path = lookup
+        parts = path.split("__") if path else []
+        for index in range(len(parts)):
+            prefetched.add(prefix + "__".join(parts[: index + 1]))
+
+        if isinstance(lookup, Prefetch) and lookup.queryset is not None and path:
+            joined = _cached_lookups(
+                lookup.queryset, f"{prefix}{path}__", joined, prefetched
+            )
+    return joined
+
+
+def _back_reference(field) -> Optional[str]:
+    """
+    The name of the relation back to the parent that Django caches on the
+    related instances of ``field`` when they are fetched, if any.
+    """
+    if field.one_to_many or (field.one_to_one and not field.concrete):
+        # Reverse foreign keys and one-to-one relations set the foreign key
+        return field.field.name
+    if field.one_to_one:
+        return field.remote_field.get_accessor_name()
+    return None
+
+
+def _relation_caching(
+    model: Type[Model],
+    transforms: Iterable[InstanceTransform],
+    prefix: str,
+    path_prefix: str,
+    joined: Optional[Set[str]],
+    prefetched: Set[str],
+    caching: Dict[str, bool],
+    back: Optional[str] = None,
+):
+    _model_fields = model_fields(model)
+    for transform in transforms:
+        compile = getattr(transform, "compile", None)
+        if compile is None:
+            continue
+
+        for entry in compile(model):
+            relation_transforms = getattr(entry.transform, "transforms", None)
+            field = _model_fields.get(entry.name)
+            if (
+                relation_transforms is None
+                or field is None
+                or field.related_model is None
+            ):
+                continue
+
+            accessor = entry.name if field.concrete else field.get_accessor_name()
+            lookup = f"{prefix}{accessor}"
+            path = f"{path_prefix}{entry.name}"
+            if lookup in prefetched or (
+                not entry.transform.many and entry.name == back
+            ):
+                cached = True
+            elif entry.transform.many:
+                cached = False
+            elif joined is None:
+                # Unknown, left to be checked row by row
+                continue
+            elif lookup in joined:
+                cached = True
+            elif prefix:
+                # Django may cache nested relations as a side effect of the
+                # lookups, so they are left to be checked row by row
+                continue
+            else:
+                cached = False
+
+            caching[path] = cached
+            if cached:
+                _relation_caching(
+                    field.related_model,
+                    relation_transforms,
+                    f"{lookup}__",
+                    f"{path}.",
+                    joined,
+                    prefetched,
+                    caching,
+                    _back_reference(field),
+                )
+
+
+def relation_caching(
+    qs: QuerySet, transforms: Iterable[InstanceTransform]
+) -> Dict[str, bool]:
+    """
+    Find out up front whether each ref() and refs() relation of ``transforms``
+    is cached by the select_related and prefetch_related lookups of ``qs``.
+    The result is keyed by the dotted path of the relation, and relations
+    that can't be known are left out. Relations back to the parent of a
+    reverse or one-to-one relation count as cached, as Django caches them
+    when fetching the related instances.
+    """
+    prefetched: Set[str] = set()
+    joined = _cached_lookups(qs, "", set(), prefetched)
+    caching: Dict[str, bool] = {}
+    _relation_caching(qs.model, transforms, "", "", joined, prefetched, caching)
+    return caching
+
+
+def optimize(qs: QuerySet, transforms: Iterable[InstanceTransform]) -> QuerySet:
+    """
+    Apply the select_related, prefetch_related and only calls that serializing
+    ``qs`` with ``transforms`` requires.
+
+    Forward and one-to-one relations read with ref() are joined with
+    select_related, many relations read with refs() are fetched with a Prefetch
+    whose queryset is optimized in turn. Columns are only restricted when every
+    transform on the way is a field selection; custom callables may read
+    anything and leave the queryset unrestricted.
+    """
+    return _optimize(qs, transforms)
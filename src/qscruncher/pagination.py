@@ -0,0 +1,158 @@
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+from typing import Any, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Field, Q, QuerySet
+
+from .qscruncher import (
+    InstanceTransform,
+    Value,
+    _flat_columns,
+    _prepare,
+    _serialize_chunk,
+    _values_qs,
+    compile_transforms,
+)
+
+
+class Page(NamedTuple):
+    rows: List[Value]
+    # Pass as ``after`` to get the next page, None on the last page
+    next_cursor: Optional[str]
+
+
+Key = Tuple[Tuple[str, bool, Field], ...]
+
+
+def _key(qs: QuerySet, key: Union[str, Sequence[str]]) -> Key:
+    """
+    Parse ``key`` into (attname, descending, field) triples of concrete fields.
+    """
+    names = (key,) if isinstance(key, str) else tuple(key)
+    if not names:
+        raise ValueError("Pagination requires a key")
+
+    parsed = []
+    for name in names:
+        descending = name.startswith("-")
+        name = name.lstrip("-")
+        field = qs.model._meta.pk if name == "pk" else qs.model._meta.get_field(name)
+        if not field.concrete or field.many_to_many:
+            raise ValueError(f"Pagination key {name} must be a concrete field")
+        parsed.append((field.attname, descending, field))
+    return tuple(parsed)
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    """
+    Encodes the key values losslessly. DjangoJSONEncoder truncates times to
+    milliseconds, which would repeat rows on the following page.
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.date, datetime.time)):
+            return o.isoformat()
+        if isinstance(o, Decimal):
+            return str(o)
+        return super().default(o)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    data = json.dumps(list(values), cls=_CursorEncoder, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, length: int) -> List[Any]:
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid pagination cursor")
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError("Invalid pagination cursor")
+    return values
+
+
+def _key_values(key: Key, cursor: str) -> List[Any]:
+    """
+    Decode the key values of ``cursor`` back into their Python types.
+    """
+    values = decode_cursor(cursor, len(key))
+    try:
+        return [field.to_python(value) for (_, _, field), value in zip(key, values)]
+    except ValidationError:
+        raise ValueError("Invalid pagination cursor")
+
+
+def _after(key: Key, values: Sequence[Any]) -> Q:
+    """
+    Match the rows that come after ``values`` in the order of ``key``.
+    """
+    conditions = []
+    for index, (attname, descending, _) in enumerate(key):
+        lookups = {name: value for (name, _, _), value in zip(key[:index], values)}
+        lookups[f"{attname}__{'lt' if descending else 'gt'}"] = values[index]
+        conditions.append(Q(**lookups))
+    return reduce(or_, conditions)
+
+
+def paginate(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    after: Optional[str] = None,
+    limit: int = 100,
+    key: Union[str, Sequence[str]] = "pk",
+) -> Page:
+    """
+    Serialize the page of at most ``limit`` rows of ``qs`` that follows the
+    cursor ``after``. The rows are ordered by ``key``, a unique non-null field
+    or a sequence of fields that are unique together, each optionally
+    prefixed with ``-`` for descending order.
+
+    Instead of an offset, each page filters on the key values of the last row
+    of the previous page, so deep pages cost the same as the first one. The
+    prefetching and relation loading only cover the rows of the page.
+    """
+    if limit < 1:
+        raise ValueError("Pagination limit must be positive")
+
+    parsed = _key(qs, key)
+    attnames = tuple(attname for attname, _, _ in parsed)
+    qs = qs.order_by(
+        *(f"-{attname}" if descending else attname for attname, descending, _ in parsed)
+    )
+    if after is not None:
+        qs = qs.filter(_after(parsed, _key_values(parsed, after)))
+    qs = qs[: limit + 1]
+
+    transforms = compile_transforms(qs.model, transforms)
+    if _values_qs(qs) and (columns := _flat_columns(qs.model, transforms)):
+        names, columns_attnames = columns
+        values = list(
+            qs.prefetch_related(None).values_list(*attnames, *columns_attnames)
+        )
+        more = len(values) > limit
+        values = values[:limit]
+        split = len(attnames)
+        rows = [dict(zip(names, row[split:])) for row in values]
+        last = values[-1][:split] if values else None
+    else:
+        qs, transforms, loaders = _prepare(qs, transforms)
+        instances = list(qs)
+        more = len(instances) > limit
+        instances = instances[:limit]
+        rows = _serialize_chunk(instances, transforms, loaders)
+        last = (
+            [getattr(instances[-1], attname) for attname in attnames]
+            if instances
+            else None
+        )
+
+    return Page(rows, encode_cursor(last) if more else None)
@@ -0,0 +1,125 @@
+import multiprocessing
+from math import ceil
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import django
+from django.apps import apps
+from django.db import connections
+from django.db.models import IntegerField, Max, Min, QuerySet
+
+from .qscruncher import InstanceTransform, Value, qs_to_list
+
+# The job of the current worker process, set up by _init_worker
+_job: Optional[Tuple[QuerySet, Tuple[InstanceTransform, ...], Optional[str]]] = None
+
+
+def _pk_ranges(qs: QuerySet, parts: int) -> List[Tuple[int, int]]:
+    bounds = qs.aggregate(low=Min("pk"), high=Max("pk"))
+    low, high = bounds["low"], bounds["high"]
+    if low is None:
+        return []
+    if not isinstance(low, int):
+        raise ValueError("Parallel serialization requires an integer primary key")
+
+    step = max(1, ceil((high - low + 1) / parts))
+    return [
+        (start, min(start + step - 1, high)) for start in range(low, high + 1, step)
+    ]
+
+
+def _unsupported_reason(qs: QuerySet) -> Optional[str]:
+    """
+    Why ``qs`` can't be serialized in worker processes, or None if it can.
+    Only querysets of integer primary keys split into ranges, sliced and
+    distinct ones don't, and the rows would not come out in any ordering
+    other than by primary key. Workers can't see uncommitted changes either.
+    """
+    if not isinstance(qs, QuerySet):
+        return "Parallel serialization requires a QuerySet"
+    if qs.query.is_sliced:
+        return "Parallel serialization can't split a sliced QuerySet"
+    if qs.query.distinct:
+        return "Parallel serialization can't split a distinct QuerySet"
+
+    pk = qs.model._meta.pk
+    pk_field = pk
+    while pk_field.is_relation:
+        # Primary keys of child models refer to the ones of their parents
+        pk_field = pk_field.target_field
+    if not isinstance(pk_field, IntegerField):
+        return "Parallel serialization requires an integer primary key"
+
+    ordering = qs.query.order_by or (
+        qs.query.default_ordering and qs.model._meta.ordering or ()
+    )
+    if any(name not in ("pk", pk.name, pk.attname) for name in ordering):
+        return "Parallel serialization requires a QuerySet ordered by primary key"
+
+    if connections[qs.db].in_atomic_block:
+        return "Parallel serialization can't run inside a transaction"
+    return None
+
+
+def _init_worker(model, db, query, prefetch_lookups, transforms, memo):
+    global _job
+
+    # Spawned workers start with an unconfigured Django
+    if not apps.ready:
+        django.setup()
+
+    qs = model._default_manager.using(db)
+    qs.query = query
+    _job = (qs.prefetch_related(*prefetch_lookups), transforms, memo)
+
+
+def _serialize_range(pk_range: Tuple[int, int]) -> List[Value]:
+    qs, transforms, memo = _job
+    low, high = pk_range
+    return qs_to_list(qs.filter(pk__gte=low, pk__lte=high), transforms, memo=memo)
+
+
+def parallel_qs_to_iter(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    workers: int,
+    start_method: Optional[str] = None,
+    memo: Optional[str] = None,
+) -> Iterator[Value]:
+    """
+    Serialize ``qs`` in a pool of ``workers`` processes. The queryset is split
+    into primary key ranges which are serialized with their own database
+    connections, and the rows are yielded in primary key order. The queryset
+    must not be sliced or distinct, nor ordered by anything but the primary
+    key.
+
+    The queryset and the transforms are pickled to the workers, so any
+    ``start_method`` of multiprocessing can be used as long as custom
+    transforms are picklable. The queryset must not be evaluated inside a
+    transaction, as the workers would not see its uncommitted changes.
+    ``memo`` works like in qs_to_list, within each primary key range.
+    """
+    reason = _unsupported_reason(qs)
+    if reason is not None:
+        raise ValueError(reason)
+
+    qs = qs.order_by("pk")
+    pk_ranges = _pk_ranges(qs, workers * 4)
+
+    context = multiprocessing.get_context(start_method)
+    if context.get_start_method() == "fork":
+        # Forked workers must not share the connection of the parent process
+        connections[qs.db].close()
+    with context.Pool(
+        workers,
+        initializer=_init_worker,
+        initargs=(
+            qs.model,
+            qs.db,
+            qs.query,
+            qs._prefetch_related_lookups,
+            tuple(transforms),
+            memo,
+        ),
+    ) as pool:
+        for rows in pool.imap(_serialize_range, pk_ranges):
+            yield from rows
@@ -0,0 +1,140 @@
+import dataclasses
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator
+
+from django.db import connections
+from django.db.models import Model, QuerySet
+from django.dispatch import Signal
+
+from .loader import RelationLoader
+from .qscruncher import FieldTransform, Value, _active_profile, _Relation
+
+# Sent with a ``stats`` keyword when a profile() block exits
+serialization_profiled = Signal()
+
+
+@dataclasses.dataclass
+class TransformStats:
+    calls: int = 0
+    instances: int = 0
+    seconds: float = 0.0
+
+
+@dataclasses.dataclass
+class ProfileStats:
+    """
+    Serialization statistics collected within a profile() block.
+
+    ``transforms`` is keyed by the dotted path of each field transform, eg.
+    ``foreign_key`` or ``foreign_key.reversemodel_set``. The time of a
+    relation includes the time of the transforms nested in it, and its
+    ``instances`` counts the related instances serialized.
+    """
+
+    calls: int = 0
+    rows: int = 0
+    queries: int = 0
+    seconds: float = 0.0
+    transforms: Dict[str, TransformStats] = dataclasses.field(default_factory=dict)
+
+    @property
+    def instances(self) -> int:
+        return self.rows + sum(stats.instances for stats in self.transforms.values())
+
+
+class _TimedTransform:
+    __slots__ = ("transform", "stats", "relation")
+
+    def __init__(self, transform: FieldTransform, stats: TransformStats, relation):
+        self.transform = transform
+        self.stats = stats
+        self.relation = relation
+
+    def __call__(self, instance: Model, name: str, data: dict):
+        start = time.perf_counter()
+        self.transform(instance, name, data)
+        stats = self.stats
+        stats.seconds += time.perf_counter() - start
+        stats.calls += 1
+        if self.relation:
+            value = data[name]
+            if isinstance(value, list):
+                stats.instances += len(value)
+            elif value is not None:
+                stats.instances += 1
+
+
+def _timed(
+    stats: ProfileStats, path: str, field_transform: FieldTransform, relation: bool
+) -> FieldTransform:
+    try:
+        transform_stats = stats.transforms[path]
+    except KeyError:
+        transform_stats = stats.transforms[path] = TransformStats()
+    return _TimedTransform(field_transform, transform_stats, relation)
+
+
+def instrumenter(stats: ProfileStats) -> Callable[[str, FieldTransform], Any]:
+    """
+    A rewrite for rewrite_field_transforms that wraps field transforms with timers.
+    """
+
+    def instrument(path: str, field_transform: FieldTransform) -> FieldTransform:
+        # Native relation loaders serve relations too
+        relation = isinstance(field_transform, (_Relation, RelationLoader))
+        return _timed(stats, path, field_transform, relation)
+
+    return instrument
+
+
+@contextmanager
+def record(stats: ProfileStats, qs: QuerySet):
+    """
+    Add the time and database queries spent within the block to ``stats``.
+    """
+
+    def count_query(execute, sql, params, many, context):
+        stats.queries += 1
+        return execute(sql, params, many, context)
+
+    db = qs.db if isinstance(qs, QuerySet) else "default"
+    start = time.perf_counter()
+    try:
+        with connections[db].execute_wrapper(count_query):
+            yield
+    finally:
+        stats.seconds += time.perf_counter() - start
+
+
+def record_iter(
+    stats: ProfileStats, qs: QuerySet, rows: Iterator[Value]
+) -> Iterator[Value]:
+    iterator = iter(rows)
+    while True:
+        with record(stats, qs):
+            try:
+                row = next(iterator)
+            except StopIteration:
+                return
+        stats.rows += 1
+        yield row
+
+
+@contextmanager
+def profile():
+    """
+    Collect ProfileStats of the serialization done within the block:
+
+        with profile() as stats:
+            qs_to_list(qs, fields("id"))
+
+    The stats are also sent with the serialization_profiled signal on exit.
+    """
+    stats = ProfileStats()
+    token = _active_profile.set(stats)
+    try:
+        yield stats
+    finally:
+        _active_profile.reset(token)
+        serialization_profiled.send(None, stats=stats)
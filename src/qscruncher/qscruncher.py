@@ -1,20 +1,54 @@
+import dataclasses
 import logging
-from functools import lru_cache
-from typing import Any, Callable, Iterable, List, Optional, Type, Union
-
-from django.conf import settings
-from django.db.models import (
-    Field,
-    ForeignKey,
-    ManyToManyField,
-    ManyToOneRel,
-    Model,
-    OneToOneField,
-    QuerySet,
+from contextvars import ContextVar
+from itertools import islice
+from operator import attrgetter
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
+
+from django.db.models import Field, Model, QuerySet, prefetch_related_objects
+from django.db.models.fields.related_descriptors import ForeignKeyDeferredAttribute
+from django.db.models.query import ModelIterable
+from django.db.models.query_utils import DeferredAttribute
+
+from .conf import get_config
+from .meta import (
+    FOREIGN_KEY,
+    MANY_TO_MANY,
+    ONE_TO_ONE,
+    REVERSE,
+    FieldMeta,
+    model_compiled,
+    model_fields,
+    model_meta,
 )
 
 logger = logging.getLogger(__name__)
 
+_column_descriptors = (DeferredAttribute, ForeignKeyDeferredAttribute)
+
+# The ProfileStats of an active profile() block
+_active_profile: ContextVar[Optional[Any]] = ContextVar(
+    "qscruncher_profile", default=None
+)
+# The QueryBudget of an active query_budget() block
+_active_budget: ContextVar[Optional[Any]] = ContextVar(
+    "qscruncher_budget", default=None
+)
+
 Value = Optional[Union[str, int, float, dict, list, bool]]
 FieldTransform = Callable[[Model, str, Any], Value]
 InstanceTransform = Callable[[Model, Value], Value]
@@ -29,82 +63,337 @@ def raise_uncached_relation_error(msg):
 
 
 def handle_uncached_relation(msg):
-    signal = getattr(settings, "QSCRUNCHER_UNCACHED_RELATION_SIGNAL", None)
-    if signal:
-        signal.send(None, msg=msg)
+    config = get_config()
+    if config.uncached_relation_signal:
+        config.uncached_relation_signal.send(None, msg=msg)
 
-    if not getattr(settings, "QSCRUNCHER_UNCACHED_RELATION_NO_WARN", False):
+    if not config.uncached_relation_no_warn:
         logger.warning(msg)
 
-    if not getattr(settings, "QSCRUNCHER_UNCACHED_RELATION_NO_RAISE", False):
+    if not config.uncached_relation_no_raise:
         raise_uncached_relation_error(msg)
 
 
-def ref(transforms: Iterable[InstanceTransform]) -> FieldTransform:
-    def transform(instance: Model, name: str, data: dict):
-        if not getattr(instance._meta.model, name).is_cached(instance):
+@dataclasses.dataclass(frozen=True)
+class _Spec:
+    """
+    Base of the transform specs. Specs are immutable, compare and hash by their
+    structure, and pickle as such. What they compile for a model is kept in
+    the model metadata registry, see meta.model_compiled, except for specs
+    rewritten for a single call, which keep it to themselves.
+    """
+
+    _per_call: Optional[Dict[Type[Model], Any]] = dataclasses.field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def _compiled_for(self, model: Type[Model], compile: Callable[[], Any]) -> Any:
+        per_call = self._per_call
+        if per_call is None:
+            return model_compiled(model, self, compile)
+        try:
+            return per_call[model]
+        except KeyError:
+            compiled = per_call[model] = compile()
+            return compiled
+
+
+@dataclasses.dataclass(frozen=True)
+class _Relation(_Spec):
+    transforms: Tuple[InstanceTransform, ...]
+    # Cleared once the relation is known to be cached for the whole queryset
+    check: bool = dataclasses.field(default=True, repr=False)
+    many: ClassVar[bool]
+
+    def _compiled(self, model: Type[Model]) -> Tuple[InstanceTransform, ...]:
+        return self._compiled_for(
+            model, lambda: compile_transforms(model, self.transforms)
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class Ref(_Relation):
+    many: ClassVar[bool] = False
+
+    def _relation_instance(self, instance: Model, name: str) -> Optional[Model]:
+        if self.check and not model_meta(instance._meta.model)[
+            name
+        ].descriptor.is_cached(instance):
             # TODO check that this works with prefetch_related?
             handle_uncached_relation(
                 f"Field {name} is missing select_related or prefetch_related"
             )
+        return getattr(instance, name)
 
-        data[name] = instance_to_value(getattr(instance, name), transforms)
+    def __call__(self, instance: Model, name: str, data: dict):
+        relation_instance = self._relation_instance(instance, name)
+        if relation_instance is None:
+            data[name] = None
+            return
 
-    return transform
+        data[name] = instance_to_value(
+            relation_instance, self._compiled(relation_instance.__class__)
+        )
 
 
-def refs(transforms: Iterable[InstanceTransform]) -> FieldTransform:
-    def transform(instance: Model, name: str, data: dict):
-        if name not in getattr(instance, "_prefetched_objects_cache", []):
-            handle_uncached_relation(f"Field {name} is missing prefetch_related")
+@dataclasses.dataclass(frozen=True)
+class Refs(_Relation):
+    many: ClassVar[bool] = True
 
+    def _relation_instances(self, instance: Model, name: str) -> List[Model]:
+        if self.check and name not in getattr(
+            instance, "_prefetched_objects_cache", []
+        ):
+            handle_uncached_relation(f"Field {name} is missing prefetch_related")
+        try:
+            return instance._prefetched_objects_cache[name]
+        except (AttributeError, KeyError):
+            # Reported already, so fall back to querying the relation
+            return list(getattr(instance, name).all())
+
+    def __call__(self, instance: Model, name: str, data: dict):
+        relation_instances = self._relation_instances(instance, name)
+        if not relation_instances:
+            data[name] = []
+            return
+
+        relation_transforms = self._compiled(relation_instances[0].__class__)
         data[name] = [
-            instance_to_value(relation_instance, transforms)
-            for relation_instance in instance._prefetched_objects_cache[name]
+            instance_to_value(relation_instance, relation_transforms)
+            for relation_instance in relation_instances
         ]
 
-    return transform
+
+@dataclasses.dataclass(frozen=True)
+class Pk(_Spec):
+    def __call__(self, instance: Model, _) -> Value:
+        return instance.pk
+
+
+def _relation_transforms(
+    transforms: Union[InstanceTransform, Iterable[InstanceTransform]],
+) -> Tuple[InstanceTransform, ...]:
+    # A single transform is accepted for convenience
+    if callable(transforms):
+        return (transforms,)
+    return tuple(transforms)
+
+
+def ref(transforms: Iterable[InstanceTransform]) -> FieldTransform:
+    return Ref(_relation_transforms(transforms))
 
 
-def _select_fields(
-    instance: Model, fields: List[Field], data: Value, **kwargs: FieldTransform
-) -> Value:
-    for field in fields:
-        if field.name in kwargs:
-            # TODO could have automatic introspection here? make single_relation and many_relations private
-            kwargs[field.name](instance, field.name, data)
-
-        elif isinstance(field, ForeignKey) or isinstance(field, OneToOneField):
-            data[field.name] = getattr(instance, field.db_column or f"{field.name}_id")
-        elif isinstance(field, ManyToManyField):
-            refs([pk()])(instance, field.name, data)
-        elif isinstance(field, ManyToOneRel):
-            refs([pk()])(instance, field.get_accessor_name(), data)
+def refs(transforms: Iterable[InstanceTransform]) -> FieldTransform:
+    return Refs(_relation_transforms(transforms))
+
+
+def pk() -> InstanceTransform:
+    return Pk()
+
+
+class PlanEntry(NamedTuple):
+    """
+    A precomputed field accessor. Either ``attname`` is read straight off the
+    instance, or ``transform`` is called to write the value into data.
+    """
+
+    name: str
+    attname: Optional[str]
+    transform: Optional[FieldTransform]
+
+
+Plan = Tuple[PlanEntry, ...]
+
+
+def _plan_entry(name: str, meta: FieldMeta):
+    if meta.kind in (FOREIGN_KEY, ONE_TO_ONE):
+        return PlanEntry(name, meta.attname, None)
+    if meta.kind in (MANY_TO_MANY, REVERSE):
+        return PlanEntry(name, None, _pk_refs)
+    return PlanEntry(name, meta.field.name, None)
+
+
+def _run_plan(instance: Model, plan: Plan, data: Value) -> Value:
+    for name, attname, field_transform in plan:
+        if field_transform is None:
+            data[name] = getattr(instance, attname)
         else:
-            data[field.name] = getattr(instance, field.name)
+            field_transform(instance, name, data)
 
     return data
 
 
-def _field_name(field):
-    if isinstance(field, ManyToOneRel):
-        return field.get_accessor_name()
-    return field.name
+@dataclasses.dataclass(frozen=True)
+class _FieldSelection(_Spec):
+    def _select_names(self, _model_fields: Dict[str, Field]) -> Iterable[str]:
+        raise NotImplementedError
 
+    def compile(self, model: Type[Model]) -> Plan:
+        return self._compiled_for(model, lambda: _compile_plan(self, model))
 
-@lru_cache(maxsize=1024)
-def model_fields(model: Type[Model]):
-    return {_field_name(field): field for field in model._meta.get_fields()}
+    def __call__(self, instance: Model, data: Value) -> Value:
+        return _run_plan(instance, self.compile(instance.__class__), data)
 
 
-def all_fields(**kwargs: FieldTransform) -> InstanceTransform:
+def _compile_plan(selection: _FieldSelection, model: Type[Model]) -> Plan:
+    _model_fields = model_fields(model)
+    _model_meta = model_meta(model)
+    kwargs = dict(selection.kwargs)
+    # Keyword transforms may also add keys that aren't fields of the model
+    return tuple(
+        (
+            PlanEntry(name, None, kwargs[name])
+            if name in kwargs
+            else _plan_entry(name, _model_meta[name])
+        )
+        for name in selection._select_names(_model_fields)
+    )
+
+
+@dataclasses.dataclass(frozen=True)
+class Fields(_FieldSelection):
+    names: Tuple[str, ...]
+    kwargs: Tuple[Tuple[str, FieldTransform], ...] = ()
+
+    def _select_names(self, _model_fields: Dict[str, Field]) -> Iterable[str]:
+        return self.names + tuple(k for k, _ in self.kwargs if k not in self.names)
+
+
+@dataclasses.dataclass(frozen=True)
+class Exclude(_FieldSelection):
+    names: Tuple[str, ...]
+    kwargs: Tuple[Tuple[str, FieldTransform], ...] = ()
+
+    def __post_init__(self):
+        for key, _ in self.kwargs:
+            if key in self.names:
+                raise ValueError(f"{key} is excluded!")
+
+    def _select_names(self, _model_fields: Dict[str, Field]) -> Iterable[str]:
+        return [name for name in _model_fields.keys() if name not in self.names]
+
+
+@dataclasses.dataclass(frozen=True)
+class AllFields(_FieldSelection):
+    kwargs: Tuple[Tuple[str, FieldTransform], ...] = ()
+
+    def _select_names(self, _model_fields: Dict[str, Field]) -> Iterable[str]:
+        return _model_fields.keys()
+
+
+_pk_refs = Refs((Pk(),))
+
+
+def _plan_runner(plan: Plan) -> InstanceTransform:
     def transform(instance: Model, data: Value) -> Value:
-        _model_fields = model_fields(instance._meta.model)
-        return _select_fields(instance, list(_model_fields.values()), data, **kwargs)
+        return _run_plan(instance, plan, data)
+
+    transform.compile = lambda model: plan
+    return transform
+
 
+def _compiled_per_call(transform: Any) -> Any:
+    # Rewritten specs may hold per-call state, eg. memos or query budgets,
+    # that equal specs of other calls must not be compiled with
+    if isinstance(transform, _Spec) and transform._per_call is None:
+        object.__setattr__(transform, "_per_call", {})
     return transform
 
 
+def _rewrite_field(
+    path: str, field_transform: FieldTransform, rewrite: Callable
+) -> FieldTransform:
+    if isinstance(field_transform, _Relation):
+        field_transform = _compiled_per_call(
+            dataclasses.replace(
+                field_transform,
+                transforms=tuple(
+                    _rewrite_spec(path, transform, rewrite)
+                    for transform in field_transform.transforms
+                ),
+            )
+        )
+    rewritten = rewrite(path, field_transform)
+    return rewritten if rewritten is field_transform else _compiled_per_call(rewritten)
+
+
+def _rewrite_spec(
+    prefix: str, transform: InstanceTransform, rewrite: Callable
+) -> InstanceTransform:
+    if not isinstance(transform, _FieldSelection):
+        return transform
+
+    kwargs = tuple(
+        (name, _rewrite_field(f"{prefix}.{name}", field_transform, rewrite))
+        for name, field_transform in transform.kwargs
+    )
+    return _compiled_per_call(dataclasses.replace(transform, kwargs=kwargs))
+
+
+def rewrite_field_transforms(
+    model: Type[Model],
+    transforms: Tuple[InstanceTransform, ...],
+    rewrite: Callable[[str, FieldTransform], FieldTransform],
+) -> Tuple[InstanceTransform, ...]:
+    """
+    Replace the field transforms of compiled ``transforms`` with the result of
+    ``rewrite(path, field_transform)``. Field transforms passed as keyword
+    arguments within ref() and refs() are rewritten as well, with a dotted
+    path, before the relation itself is rewritten.
+    """
+    rewritten = []
+    for transform in transforms:
+        compile = getattr(transform, "compile", None)
+        if compile is not None:
+            transform = _plan_runner(
+                tuple(
+                    (
+                        PlanEntry(
+                            entry.name,
+                            None,
+                            _rewrite_field(entry.name, entry.transform, rewrite),
+                        )
+                        if entry.transform is not None
+                        else entry
+                    )
+                    for entry in compile(model)
+                )
+            )
+        rewritten.append(transform)
+    return tuple(rewritten)
+
+
+def compile_transforms(
+    model: Type[Model], transforms: Iterable[InstanceTransform]
+) -> Tuple[InstanceTransform, ...]:
+    """
+    Resolve the field plans of ``transforms`` for ``model`` up front, merging
+    consecutive plans into one so that rows are serialized in a single pass.
+    Transforms without a plan (eg. ``pk()`` or custom callables) are kept as is.
+    """
+    compiled: List[InstanceTransform] = []
+    plan: Optional[Plan] = None
+    for transform in transforms:
+        compile = getattr(transform, "compile", None)
+        if compile is None:
+            if plan is not None:
+                compiled.append(_plan_runner(plan))
+                plan = None
+            compiled.append(transform)
+        elif plan is None:
+            plan = compile(model)
+        else:
+            plan = plan + compile(model)
+
+    if plan is not None:
+        compiled.append(_plan_runner(plan))
+    return tuple(compiled)
+
+
+def all_fields(**kwargs: FieldTransform) -> InstanceTransform:
+    return AllFields(tuple(kwargs.items()))
+
+
 def model_serializer_fields(
     model_serializer, **kwargs: FieldTransform
 ) -> InstanceTransform:
@@ -119,50 +408,13 @@ def model_serializer_fields(
 
 
 def fields(names: Iterable[str], **kwargs: FieldTransform) -> InstanceTransform:
-    extended_names = []
-    extended_names.extend(names)
-    extended_names.extend([k for k in kwargs.keys() if k not in names])
-
-    def transform(instance: Model, data: Value):
-        _model_fields = model_fields(instance._meta.model)
-        return _select_fields(
-            instance,
-            [_model_fields[name] for name in extended_names],
-            data,
-            **kwargs,
-        )
-
-    return transform
+    return Fields(tuple(names), tuple(kwargs.items()))
 
 
 def exclude(
     exclude_names: Iterable[str], **kwargs: FieldTransform
 ) -> InstanceTransform:
-    for key in kwargs.keys():
-        if key in exclude_names:
-            raise ValueError(f"{key} is excluded!")
-
-    def transform(instance: Model, data: Value):
-        _model_fields = model_fields(instance._meta.model)
-        return _select_fields(
-            instance,
-            [
-                _model_fields[name]
-                for name in _model_fields.keys()
-                if name not in exclude_names
-            ],
-            data,
-            **kwargs,
-        )
-
-    return transform
-
-
-def pk() -> InstanceTransform:
-    def transform(instance: Model, _):
-        return instance.pk
-
-    return transform
+    return Exclude(tuple(exclude_names), tuple(kwargs.items()))
 
 
 def instance_to_value(
@@ -177,5 +429,407 @@ def instance_to_value(
     return data
 
 
-def qs_to_list(qs: QuerySet, transforms: Iterable[InstanceTransform]):
-    return [instance_to_value(instance, transforms) for instance in qs]
+def _flat_columns(
+    model: Type[Model], transforms: Tuple[InstanceTransform, ...]
+) -> Optional[Tuple[Tuple[str, ...], Tuple[str, ...]]]:
+    """
+    Return the output keys and attnames of compiled ``transforms`` if they only
+    read plain database columns, None otherwise.
+    """
+    if len(transforms) != 1:
+        return None
+
+    compile = getattr(transforms[0], "compile", None)
+    if compile is None:
+        return None
+
+    names = []
+    attnames = []
+    for name, attname, field_transform in compile(model):
+        # Fields with custom descriptors (eg. FileField) don't return the column value
+        if (
+            field_transform is not None
+            or type(getattr(model, attname, None)) not in _column_descriptors
+        ):
+            return None
+        names.append(name)
+        attnames.append(attname)
+    return tuple(names), tuple(attnames)
+
+
+def _values_qs(qs: QuerySet) -> bool:
+    return (
+        isinstance(qs, QuerySet)
+        and qs._result_cache is None
+        and qs._iterable_class is ModelIterable
+        and not qs.query.distinct
+        and not qs.query.combinator
+    )
+
+
+def _deferred_names(qs: QuerySet) -> Set[str]:
+    names, defer = qs.query.deferred_loading
+    if defer:
+        return {name for name in names if "__" not in name}
+
+    loaded = {name.split("__", 1)[0] for name in names}
+    return {
+        field.name
+        for field in qs.model._meta.concrete_fields
+        if field.name not in loaded and not field.primary_key
+    }
+
+
+def _check_deferred_fields(
+    qs: QuerySet, transforms: Tuple[InstanceTransform, ...]
+) -> None:
+    """
+    Report the fields that compiled ``transforms`` read but ``qs`` defers, as
+    reading them would cost a query per instance.
+    """
+    names, defer = qs.query.deferred_loading
+    if defer and not names:
+        return
+
+    deferred = _deferred_names(qs)
+    read = []
+    for transform in transforms:
+        compile = getattr(transform, "compile", None)
+        if compile is not None:
+            # Keyword transforms may read anything, or nothing, off the instance
+            read.extend(
+                entry.name for entry in compile(qs.model) if entry.attname is not None
+            )
+    if missing := [name for name in read if name in deferred]:
+        handle_uncached_relation(
+            f"Field{'s' if len(missing) > 1 else ''} {', '.join(missing)}"
+            f" {'are' if len(missing) > 1 else 'is'} deferred by only() or defer()"
+        )
+
+
+def _check_relation_caching(
+    qs: QuerySet, transforms: Tuple[InstanceTransform, ...]
+) -> Dict[str, bool]:
+    """
+    Check the relation caching of ``qs`` once, reporting every relation that
+    is not cached in one go. The relations found are not checked row by row.
+    """
+    from .optimizer import relation_caching
+
+    caching = relation_caching(qs, transforms)
+    if missing := [path for path, cached in caching.items() if not cached]:
+        handle_uncached_relation(
+            f"Field{'s' if len(missing) > 1 else ''} {', '.join(missing)}"
+            f" {'are' if len(missing) > 1 else 'is'} missing select_related"
+            " or prefetch_related"
+        )
+    return caching
+
+
+def _relation_check_skipper(
+    caching: Dict[str, bool],
+) -> Callable[[str, FieldTransform], FieldTransform]:
+    def skip_check(path: str, field_transform: FieldTransform) -> FieldTransform:
+        if path in caching and isinstance(field_transform, _Relation):
+            return dataclasses.replace(field_transform, check=False)
+        return field_transform
+
+    return skip_check
+
+
+def _prepare(
+    qs: QuerySet, transforms: Iterable[InstanceTransform], memo: Optional[str] = None
+) -> Tuple[QuerySet, Tuple[InstanceTransform, ...], Tuple[Any, ...]]:
+    """
+    Compile ``transforms`` for the model of ``qs`` and set up the native
+    relation loaders that replace the prefetching of ``qs`` where possible.
+    """
+    from .loader import native_loaders
+
+    transforms = compile_transforms(qs.model, transforms)
+    _check_deferred_fields(qs, transforms)
+    loaders = ()
+    if qs._result_cache is None:
+        qs, transforms, loaders = native_loaders(qs, transforms)
+
+    rewrites = []
+    caching = _check_relation_caching(qs, transforms)
+    if caching:
+        rewrites.append(_relation_check_skipper(caching))
+    if memo is not None:
+        from .memo import memoizer
+
+        rewrites.append(memoizer(memo))
+
+    stats = _active_profile.get()
+    if stats is not None:
+        from .profiling import instrumenter
+
+        rewrites.append(instrumenter(stats))
+
+    budget = _active_budget.get()
+    if budget is not None:
+        from .budget import tracker
+
+        rewrites.append(tracker(budget))
+
+    if rewrites:
+
+        def rewrite(path: str, field_transform: FieldTransform) -> FieldTransform:
+            for _rewrite in rewrites:
+                # Specs replaced by one rewrite may be wrapped by the next one
+                field_transform = _compiled_per_call(_rewrite(path, field_transform))
+            return field_transform
+
+        transforms = rewrite_field_transforms(qs.model, transforms, rewrite)
+    return qs, transforms, loaders
+
+
+def _ref_column(instances: List[Model], name: str, relation: Ref) -> List[Any]:
+    related = [relation._relation_instance(instance, name) for instance in instances]
+    present = [instance for instance in related if instance is not None]
+    if not present:
+        return related
+
+    values = iter(
+        _serialize_instances(present, relation._compiled(present[0].__class__))
+    )
+    return [None if instance is None else next(values) for instance in related]
+
+
+def _refs_column(instances: List[Model], name: str, relation: Refs) -> List[Any]:
+    related = [relation._relation_instances(instance, name) for instance in instances]
+    flat = [instance for group in related for instance in group]
+    if not flat:
+        return [[] for _ in related]
+
+    values = iter(_serialize_instances(flat, relation._compiled(flat[0].__class__)))
+    return [list(islice(values, len(group))) for group in related]
+
+
+def _serialize_plan(instances: List[Model], plan: Plan) -> List[Value]:
+    """
+    Serialize ``instances`` one field at a time: each field is read from all
+    of the instances before the columns are zipped into rows. The related
+    instances of plain ref() and refs() relations are serialized together.
+    Custom field transforms are run row by row against the row being built.
+    """
+    if not plan:
+        return [{} for _ in instances]
+
+    columns: List[Optional[List[Any]]] = []
+    for name, attname, field_transform in plan:
+        if field_transform is None:
+            columns.append(list(map(attrgetter(attname), instances)))
+        elif type(field_transform) is Ref:
+            columns.append(_ref_column(instances, name, field_transform))
+        elif type(field_transform) is Refs:
+            columns.append(_refs_column(instances, name, field_transform))
+        else:
+            columns.append(None)
+
+    if None not in columns:
+        names = [entry.name for entry in plan]
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+    # Custom field transforms may write other keys, leave their own key out
+    # or read the keys written before them, so they get the row itself
+    rows = []
+    for index, instance in enumerate(instances):
+        row: Value = {}
+        for (name, _, field_transform), column in zip(plan, columns):
+            if column is None:
+                field_transform(instance, name, row)
+            else:
+                row[name] = column[index]
+        rows.append(row)
+    return rows
+
+
+def _serialize_instances(
+    instances: List[Model], transforms: Tuple[InstanceTransform, ...]
+) -> List[Value]:
+    compile = getattr(transforms[0], "compile", None) if len(transforms) == 1 else None
+    if compile is not None and instances:
+        return _serialize_plan(instances, compile(instances[0].__class__))
+    return [instance_to_value(instance, transforms) for instance in instances]
+
+
+def _serialize_chunk(
+    instances: List[Model],
+    transforms: Tuple[InstanceTransform, ...],
+    loaders: Tuple[Any, ...],
+) -> List[Value]:
+    if instances:
+        for loader in loaders:
+            loader.load(instances)
+    return _serialize_instances(instances, transforms)
+
+
+def qs_to_list(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    workers: Optional[int] = None,
+    memo: Optional[str] = None,
+    cache: Optional[Any] = None,
+    prune: bool = False,
+    max_queries: Optional[int] = None,
+):
+    """
+    Serialize ``qs`` into a list.
+
+    With ``workers`` the queryset is serialized in a pool of processes, see
+    parallel_qs_to_iter, unless it can't be, eg. inside a transaction or when
+    it can't be split into primary key ranges. With ``memo`` set to ``share``
+    or ``copy`` each distinct instance reached through ref() is serialized
+    only once, and the rows referring to it share the result or get a
+    shallow copy of it. With a RowCache as ``cache`` only the rows missing
+    from it are serialized, see cached_qs_to_list; ``workers`` is then
+    ignored. With ``prune`` the columns fetched are restricted to the ones
+    the transforms read, see optimizer.prune.
+    With ``max_queries`` making more queries than that, including the ones of
+    the queryset itself, is reported like an uncached relation, along with
+    the SQL and the field transforms that made them.
+    """
+    if max_queries is not None:
+        from .budget import query_budget
+
+        with query_budget(qs, max_queries):
+            return qs_to_list(qs, transforms, workers, memo, cache, prune)
+
+    stats = _active_profile.get()
+    if stats is None:
+        return _qs_to_list(qs, transforms, workers, memo, cache, prune)
+
+    from .profiling import record
+
+    stats.calls += 1
+    with record(stats, qs):
+        rows = _qs_to_list(qs, transforms, workers, memo, cache, prune)
+    stats.rows += len(rows)
+    return rows
+
+
+def _qs_to_list(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    workers: Optional[int],
+    memo: Optional[str],
+    cache: Optional[Any] = None,
+    prune: bool = False,
+) -> List[Value]:
+    if prune:
+        qs, transforms = _pruned(qs, transforms)
+
+    if cache is not None:
+        from .cache import cached_qs_to_list
+
+        return cached_qs_to_list(qs, transforms, cache, memo)
+
+    if workers is not None and workers > 1:
+        from .parallel import _unsupported_reason, parallel_qs_to_iter
+
+        # Querysets that can't be split are serialized in this process
+        if _unsupported_reason(qs) is None:
+            return list(parallel_qs_to_iter(qs, transforms, workers, memo=memo))
+
+    if not isinstance(qs, QuerySet):
+        model = getattr(qs, "model", None)
+        if model is not None:
+            return _serialize_instances(list(qs), compile_transforms(model, transforms))
+        return [instance_to_value(instance, transforms) for instance in qs]
+
+    if _values_qs(qs) and (
+        columns := _flat_columns(qs.model, compile_transforms(qs.model, transforms))
+    ):
+        names, attnames = columns
+        return [
+            dict(zip(names, row))
+            for row in qs.prefetch_related(None).values_list(*attnames)
+        ]
+
+    qs, transforms, loaders = _prepare(qs, transforms, memo)
+    return _serialize_chunk(list(qs), transforms, loaders)
+
+
+def _pruned(
+    qs: QuerySet, transforms: Iterable[InstanceTransform]
+) -> Tuple[QuerySet, Tuple[InstanceTransform, ...]]:
+    transforms = tuple(transforms)
+    if isinstance(qs, QuerySet) and qs._result_cache is None:
+        from .optimizer import prune
+
+        qs = prune(qs, transforms)
+    return qs, transforms
+
+
+def _chunks(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _instance_chunks(qs: QuerySet, chunk_size: int) -> Iterator[List[Model]]:
+    """
+    Fetch ``qs`` in chunks of ``chunk_size`` instances, running its prefetch
+    lookups for each chunk separately.
+    """
+    lookups = qs._prefetch_related_lookups
+    qs = qs.prefetch_related(None)
+    for chunk in _chunks(qs.iterator(chunk_size=chunk_size), chunk_size):
+        if lookups:
+            prefetch_related_objects(chunk, *lookups)
+        yield chunk
+
+
+def qs_to_iter(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    chunk_size: int = 2000,
+    memo: Optional[str] = None,
+    prune: bool = False,
+) -> Iterator[Value]:
+    """
+    Lazily serialize ``qs`` while fetching it from the database ``chunk_size``
+    rows at a time. Prefetch lookups of the queryset are applied to each chunk
+    separately, so memory use stays bounded regardless of the queryset size.
+    ``memo`` and ``prune`` work like in qs_to_list, and memo spans all chunks.
+    """
+    stats = _active_profile.get()
+    if stats is None:
+        yield from _qs_to_iter(qs, transforms, chunk_size, memo, prune)
+        return
+
+    from .profiling import record_iter
+
+    stats.calls += 1
+    rows = _qs_to_iter(qs, transforms, chunk_size, memo, prune)
+    yield from record_iter(stats, qs, rows)
+
+
+def _qs_to_iter(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    chunk_size: int,
+    memo: Optional[str],
+    prune: bool = False,
+) -> Iterator[Value]:
+    if prune:
+        qs, transforms = _pruned(qs, transforms)
+
+    if not isinstance(qs, QuerySet) or qs._result_cache is not None:
+        yield from _qs_to_list(qs, transforms, None, memo)
+        return
+
+    if _values_qs(qs) and (
+        columns := _flat_columns(qs.model, compile_transforms(qs.model, transforms))
+    ):
+        names, attnames = columns
+        rows = qs.prefetch_related(None).values_list(*attnames)
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield dict(zip(names, row))
+        return
+
+    qs, transforms, loaders = _prepare(qs, transforms, memo)
+    for chunk in _instance_chunks(qs, chunk_size):
+        yield from _serialize_chunk(chunk, transforms, loaders)
@@ -0,0 +1,159 @@
+import csv
+import datetime
+import io
+from typing import Any, Iterable, Iterator, List, Optional, Tuple, Type
+
+from django.db.models import Model, QuerySet
+
+from .encoder import _encode, _encoded_chunks
+from .qscruncher import (
+    InstanceTransform,
+    Ref,
+    Value,
+    _active_profile,
+    _chunks,
+    compile_transforms,
+    model_fields,
+    qs_to_iter,
+)
+
+# A CSV column and the keys leading to its value in a serialized row
+Column = Tuple[str, Tuple[str, ...]]
+
+
+def _profiled_chunks(
+    qs: QuerySet, chunks: Iterator[Tuple[int, List[str]]]
+) -> Iterator[Tuple[int, List[str]]]:
+    stats = _active_profile.get()
+    if stats is None:
+        yield from chunks
+        return
+
+    from .profiling import record
+
+    stats.calls += 1
+    while True:
+        with record(stats, qs):
+            try:
+                rows, parts = next(chunks)
+            except StopIteration:
+                return
+        stats.rows += rows
+        yield rows, parts
+
+
+def qs_to_ndjson_stream(
+    qs: QuerySet, transforms: Iterable[InstanceTransform], chunk_size: int = 2000
+) -> Iterator[bytes]:
+    """
+    Serialize ``qs`` as newline delimited JSON, yielding the bytes of each
+    chunk of ``chunk_size`` rows, eg. for a StreamingHttpResponse. Rows are
+    encoded like qs_to_json_stream encodes them.
+    """
+    chunks = _encoded_chunks(qs, transforms, chunk_size, "\n")
+    for _, parts in _profiled_chunks(qs, chunks):
+        # Every row is preceded by a newline, so move the first one to the end
+        parts[0] = ""
+        parts.append("\n")
+        yield "".join(parts).encode()
+
+
+def _csv_columns(
+    model: Type[Model], transforms: Iterable[InstanceTransform]
+) -> Optional[List[Column]]:
+    """
+    The columns of rows serialized with ``transforms``, with the fields of
+    ref() relations flattened into dotted columns. None if the columns can't
+    be known up front.
+    """
+    compiled = compile_transforms(model, transforms)
+    compile = getattr(compiled[0], "compile", None) if len(compiled) == 1 else None
+    if compile is None:
+        return None
+
+    columns: List[Column] = []
+    for name, _, field_transform in compile(model):
+        related_model = getattr(model_fields(model).get(name), "related_model", None)
+        if isinstance(field_transform, Ref) and related_model is not None:
+            nested = _csv_columns(related_model, field_transform.transforms)
+            if nested is not None:
+                columns.extend(
+                    (f"{name}.{column}", (name, *keys)) for column, keys in nested
+                )
+                continue
+        columns.append((name, (name,)))
+    return columns
+
+
+def _row_columns(row: Value) -> List[Column]:
+    columns: List[Column] = []
+    for name, value in row.items():
+        if isinstance(value, dict):
+            columns.extend(
+                (f"{name}.{column}", (name, *keys))
+                for column, keys in _row_columns(value)
+            )
+        else:
+            columns.append((name, (name,)))
+    return columns
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        parts: List[str] = []
+        _encode(value, parts)
+        return "".join(parts)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def _csv_cells(row: Value, columns: List[Column]) -> List[Any]:
+    cells = []
+    for _, keys in columns:
+        value = row
+        for key in keys:
+            value = value.get(key) if isinstance(value, dict) else None
+        cells.append(_csv_value(value))
+    return cells
+
+
+def qs_to_csv_stream(
+    qs: QuerySet,
+    transforms: Iterable[InstanceTransform],
+    chunk_size: int = 2000,
+    header: bool = True,
+    **fmtparams,
+) -> Iterator[bytes]:
+    """
+    Serialize ``qs`` as CSV, yielding the UTF-8 bytes of each chunk of
+    ``chunk_size`` rows, eg. for a StreamingHttpResponse.
+
+    The fields of ref() relations are flattened into dotted columns, eg.
+    ``foreign_key.text_field``. Lists, such as refs() relations, are written
+    as JSON. When the columns can't be known from the transforms they are
+    taken from the first row. ``fmtparams`` are passed to csv.writer.
+    """
+    transforms = tuple(transforms)
+    model = getattr(qs, "model", None)
+    columns = _csv_columns(model, transforms) if model is not None else None
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, **fmtparams)
+    rows = qs_to_iter(qs, transforms, chunk_size)
+    for chunk in _chunks(rows, chunk_size):
+        if columns is None:
+            columns = _row_columns(chunk[0])
+        if header:
+            writer.writerow([column for column, _ in columns])
+            header = False
+        writer.writerows(_csv_cells(row, columns) for row in chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if header and columns is not None:
+        writer.writerow([column for column, _ in columns])
+        yield buffer.getvalue().encode()